@@ -1,5 +1,20 @@
 from django.apps import AppConfig
+from django.core.cache import cache
+from django.db.models.signals import post_migrate
+
+
+def clear_cache(sender, **kwargs):
+    # Кэш общий для процессов и переживает перезапуск: после миграций
+    # в нем могут остаться объекты прежней схемы, а после пересоздания
+    # базы (в том числе тестовой) - данные из старой
+    cache.clear()
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        # У core нет моделей, а post_migrate отправляется только от
+        # приложений с моделями, поэтому отправитель не указан
+        # и кэш очищается после миграций каждого приложения
+        post_migrate.connect(clear_cache, dispatch_uid='core.clear_cache')
@@ -0,0 +1,52 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+logger = logging.getLogger(__name__)
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _pool(name, max_workers):
+    # После fork у процесса должен быть свой пул потоков
+    key = (os.getpid(), name)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix=name
+            )
+        return _pools[key]
+
+
+def _run(name, func, args):
+    try:
+        func(*args)
+    except Exception:
+        # Ошибка задачи не должна остаться незамеченной в Future
+        logger.exception('Ошибка фоновой задачи %s', name)
+    finally:
+        # У потока свои соединения с БД, сами они не закроются
+        connections.close_all()
+
+
+def is_available():
+    """ Можно ли писать в БД из фоновых потоков. SQLite блокирует
+        файл базы на каждую запись целиком: запись потока пула
+        во время записи запроса роняет запрос с «database is locked»
+        (а база в памяти у потоков вообще своя)."""
+    return connections[DEFAULT_DB_ALIAS].vendor != 'sqlite'
+
+
+def submit(name, max_workers, func, *args):
+    """ Выполняет func(*args) в пуле потоков name (не больше
+        max_workers потоков на процесс). После задачи соединения
+        потока с БД закрываются. С SQLite (см. is_available)
+        func выполняется сразу в текущем потоке."""
+    if not is_available():
+        func(*args)
+        return
+    _pool(name, max_workers).submit(_run, name, func, args)
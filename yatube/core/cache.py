@@ -0,0 +1,658 @@
+import atexit
+import itertools
+import os
+import pickle
+import re
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict, defaultdict, namedtuple
+
+from django.contrib.sessions.backends.cached_db import \
+    KEY_PREFIX as SESSION_PREFIX
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.files import locks
+from django.core.signals import request_finished
+
+# Журнал инвалидаций в L2: номер последней записи и сами записи
+SEQUENCE_KEY = 'tiered:sequence'
+LOG_KEY = 'tiered:log:{}'
+# Запись журнала «сбросить L1 целиком»
+CLEAR_ALL = '*'
+# Счетчики по семействам ключей: снимок каждого процесса,
+# список процессов и метка последнего сброса счетчиков
+STATS_KEY = 'tiered:stats:{}'
+STATS_PROCESSES_KEY = 'tiered:stats:processes'
+STATS_RESET_KEY = 'tiered:stats:reset'
+# Семейство ключа - его начало до первого «:» или «|»
+# (page, page_gen, card, timeline, sorl-thumbnail...)
+FAMILY_RE = re.compile(r'[:|]')
+# Семейства, которые делятся дальше по второй части ключа:
+# страницы - по представлениям (page:index, page:profile...)
+NESTED_FAMILIES = {'page'}
+# Блокировки пересборки (core.single_flight) считаются по семейству
+# пересобираемого ключа: single_flight:card, single_flight:page:index
+LOCK_FAMILY = 'single_flight'
+# Ключ сессии идет сразу за префиксом, без разделителя
+SESSION_FAMILY = 'session'
+
+# Файл блокировки add в каталоге FileCache (не *.djcache, поэтому
+# его не трогают clear и _cull)
+ADD_LOCK = '.add.lock'
+
+_MISSING = object()
+_tiers = {}
+_tiers_lock = threading.Lock()
+# Значение в L2 хранится вместе с моментом истечения (time.time()
+# или None - бессрочно): копия в L1 не должна пережить запись в L2
+_Entry = namedtuple('_Entry', 'value expires')
+
+
+def _wrap(value, timeout):
+    return _Entry(value, None if timeout is None else time.time() + timeout)
+
+
+def _unwrap(stored):
+    """ Значение из L2 и сколько секунд ему осталось (None - не
+        ограничено или записано не через TieredCache)."""
+    if not isinstance(stored, _Entry):
+        return stored, None
+    if stored.expires is None:
+        return stored.value, None
+    return stored.value, stored.expires - time.time()
+
+
+class _Tier:
+    """ Состояние L1, общее для всех потоков процесса
+        (Django создает свой экземпляр бэкенда в каждом потоке)."""
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.sync_lock = threading.Lock()
+        # Номер последней прочитанной записи журнала
+        self.seen = 0
+        self.synced_at = None
+        # Свои записи журнала процесс пропускает
+        self.token = uuid.uuid4().hex
+        self.stats = Counter()
+        # Счетчики и суммарное время операций по семействам ключей
+        self.families = defaultdict(Counter)
+        self.flushed_at = None
+        self.reset_marker = None
+        # Измененные ключи, еще не записанные в журнал
+        self.pending = set()
+        self.pending_since = None
+        # Бэкенд, который публикует pending по окончании запроса
+        self.backend = None
+
+
+def publish_pending(**kwargs):
+    """ Записывает в журнал ключи, измененные процессом за запрос."""
+    pid = os.getpid()
+    for (_, tier_pid), tier in list(_tiers.items()):
+        if tier_pid == pid and tier.pending:
+            tier.backend.publish_pending()
+
+
+request_finished.connect(publish_pending, dispatch_uid='core.cache.publish')
+
+
+def key_family(key):
+    """ Семейство ключа: page:index для 'page:index:...', card для
+        'card:...', sorl-thumbnail для 'sorl-thumbnail||image||...',
+        single_flight:card для 'single_flight:lock:card:...'."""
+    if key.startswith(SESSION_PREFIX):
+        return SESSION_FAMILY
+    parts = FAMILY_RE.split(key, 2)
+    family = parts[0] or key
+    if family == LOCK_FAMILY and len(parts) == 3:
+        return f'{family}:{key_family(parts[2])}'
+    if family in NESTED_FAMILIES and len(parts) > 1:
+        return f'{family}:{parts[1]}'
+    return family
+
+
+def family_report(stats):
+    """ Строки отчета по семействам ключей (см. family_stats),
+        самые нагруженные сверху."""
+    rows = []
+    for family, counts in stats.items():
+        hits = counts.get('l1_hits', 0) + counts.get('l2_hits', 0)
+        reads = hits + counts.get('misses', 0)
+        calls = counts.get('calls', 0)
+        rows.append({
+            'family': family,
+            'hits': hits,
+            'l1_hits': counts.get('l1_hits', 0),
+            'misses': counts.get('misses', 0),
+            'hit_ratio': hits / reads if reads else None,
+            'sets': counts.get('sets', 0),
+            'deletes': counts.get('deletes', 0),
+            'evictions': counts.get('evictions', 0),
+            'avg_ms': counts.get('seconds', 0) / calls * 1000
+            if calls else None,
+        })
+    return sorted(
+        rows, key=lambda row: row['hits'] + row['misses'] + row['sets'],
+        reverse=True
+    )
+
+
+class FileCache(FileBasedCache):
+    """ Файловый кэш для L2, общий для процессов одной машины.
+
+        add атомарен и между процессами: проверка и запись ключа идут
+        под эксклюзивной блокировкой файла ADD_LOCK (flock), поэтому из
+        нескольких одновременных add одного ключа успешен ровно один.
+        На этом держатся блокировки core.single_flight и номера
+        записей журнала TieredCache. set и delete блокировку не берут.
+
+        Просроченный файл не удаляется при чтении: иначе читатель мог бы
+        удалить файл, только что записанный под тем же именем чужим add.
+        Такие файлы перезаписываются или выбрасываются при чистке.
+        Чистка (_cull) перебирает весь каталог, поэтому идет не на каждый
+        set, а раз в OPTIONS['CULL_EVERY'] записей: записей может быть
+        больше MAX_ENTRIES на столько же в каждом процессе.
+    """
+    def __init__(self, dir, params):
+        super().__init__(dir, params)
+        options = params.get('OPTIONS', {})
+        self._cull_every = int(options.get('CULL_EVERY', 1000))
+        self._sets = itertools.count(1)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._createdir()
+        with open(os.path.join(self._dir, ADD_LOCK), 'ab') as lock_file:
+            locks.lock(lock_file, locks.LOCK_EX)
+            try:
+                return super().add(key, value, timeout, version)
+            finally:
+                locks.unlock(lock_file)
+
+    def _is_expired(self, f):
+        try:
+            expires = pickle.load(f)
+        except EOFError:
+            # Пустой файл считается просроченным, как в FileBasedCache
+            return True
+        return expires is not None and expires < time.time()
+
+    def _cull(self):
+        if next(self._sets) % self._cull_every == 0:
+            super()._cull()
+
+
+class TieredCache(BaseCache):
+    """ Двухуровневый кэш: L1 - LRU в памяти процесса (не больше
+        MAX_ENTRIES записей, каждая живет не дольше L1_TIMEOUT секунд),
+        L2 - общий для процессов кэш с псевдонимом OPTIONS['L2'].
+
+        Чтение идет сначала в L1, промах - в L2 с сохранением в L1
+        (не дольше, чем записи осталось жить в L2).
+        Запись идет в L2, а измененные ключи копятся и попадают в
+        журнал инвалидаций в L2 одной записью: в конце запроса или,
+        вне запросов, не реже раза в SYNC_INTERVAL секунд. Раз в
+        SYNC_INTERVAL секунд каждый процесс читает новые записи журнала
+        и выбрасывает из своего L1 измененные другими ключи. Если
+        процесс отстал от журнала или журнал потерян, L1 сбрасывается
+        целиком. В худшем случае (гонка двух записей в журнал) значение
+        в L1 устаревает не дольше чем на L1_TIMEOUT.
+
+        Ключи с префиксами из OPTIONS['L2_ONLY'] в L1 не попадают и
+        читаются только из L2: так выход, смена пароля или блокировка
+        пользователя сразу видны всем процессам.
+
+        CACHES = {
+            'default': {
+                'BACKEND': 'core.cache.TieredCache',
+                'OPTIONS': {'L2': 'shared', 'MAX_ENTRIES': 5000},
+            },
+            'shared': {
+                'BACKEND': 'core.cache.FileCache',
+                'LOCATION': '/var/tmp/yatube_cache',
+            },
+        }
+    """
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._name = location
+        self._l2_alias = options['L2']
+        self._l1_timeout = float(options.get('L1_TIMEOUT', 5))
+        self._l2_only = tuple(options.get('L2_ONLY', ()))
+        self._sync_interval = float(options.get('SYNC_INTERVAL', 1))
+        # Записи журнала должны жить дольше, чем процесс не читает журнал
+        self._log_timeout = int(options.get('LOG_TIMEOUT', 60))
+        # Отставание (в записях), после которого L1 проще сбросить
+        self._log_batch = int(options.get('LOG_BATCH', 500))
+        # Сколько измененных ключей копить до записи в журнал
+        self._log_keys = int(options.get('LOG_KEYS', 1000))
+        # Как часто процесс публикует свои счетчики в L2 (секунды)
+        # и сколько живет снимок умершего процесса
+        self._stats_interval = float(options.get('STATS_INTERVAL', 10))
+        self._stats_timeout = int(options.get('STATS_TIMEOUT', 24 * 60 * 60))
+
+    @property
+    def _l2(self):
+        return caches[self._l2_alias]
+
+    @property
+    def _tier(self):
+        # После fork у процесса должен быть свой L1 и свой токен
+        name = (self._name, os.getpid())
+        tier = _tiers.get(name)
+        if tier is None:
+            with _tiers_lock:
+                if name not in _tiers:
+                    _tiers[name] = _Tier()
+                    _tiers[name].backend = self
+                    # Изменения и счетчики короткого процесса (команды)
+                    # иначе не дождутся публикации
+                    atexit.register(self._at_exit, _tiers[name])
+                tier = _tiers[name]
+        return tier
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _timeout(self, timeout):
+        return self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
+
+    def _count(self, name, value=1):
+        tier = self._tier
+        with tier.lock:
+            tier.stats[name] += value
+
+    def _family(self, full_key):
+        # Ключ после make_key: 'префикс:версия:ключ'
+        return key_family(full_key.split(':', 2)[-1])
+
+    def _record(self, started, events):
+        """ Учитывает операцию: events - пары (ключ, событие),
+            время операции делится между ключами поровну."""
+        if not events:
+            return
+        share = (time.perf_counter() - started) / len(events)
+        tier = self._tier
+        with tier.lock:
+            for full_key, event in events:
+                counts = tier.families[self._family(full_key)]
+                counts[event] += 1
+                counts['calls'] += 1
+                counts['seconds'] += share
+
+    # L1
+
+    def _in_l1(self, full_key):
+        return not full_key.split(':', 2)[-1].startswith(self._l2_only)
+
+    def _l1_get(self, key):
+        if not self._in_l1(key):
+            return _MISSING
+        tier = self._tier
+        with tier.lock:
+            entry = tier.entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                tier.entries.move_to_end(key)
+                tier.stats['l1_hits'] += 1
+                return pickle.loads(entry[0])
+            if entry is not None:
+                del tier.entries[key]
+            tier.stats['l1_misses'] += 1
+        return _MISSING
+
+    def _l1_set(self, key, value, timeout=None):
+        ttl = self._l1_timeout
+        if timeout is not None:
+            ttl = min(ttl, timeout)
+        if ttl <= 0 or not self._in_l1(key):
+            self._l1_delete([key])
+            return
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        tier = self._tier
+        with tier.lock:
+            tier.entries[key] = (pickled, time.monotonic() + ttl)
+            tier.entries.move_to_end(key)
+            while len(tier.entries) > self._max_entries:
+                evicted, _ = tier.entries.popitem(last=False)
+                tier.families[self._family(evicted)]['evictions'] += 1
+
+    def _l1_delete(self, keys):
+        tier = self._tier
+        with tier.lock:
+            for key in keys:
+                tier.entries.pop(key, None)
+
+    def _l1_clear(self):
+        tier = self._tier
+        with tier.lock:
+            tier.entries.clear()
+
+    # Журнал инвалидаций
+
+    def _apply_log(self, tier, head):
+        slots = [LOG_KEY.format(n) for n in range(tier.seen + 1, head + 1)]
+        entries = self._l2.get_many(slots)
+        if len(entries) < len(slots):
+            # Часть записей истекла или вытеснена
+            self._l1_clear()
+            return
+        for token, keys in entries.values():
+            if token == tier.token:
+                continue
+            if CLEAR_ALL in keys:
+                self._l1_clear()
+            else:
+                self._l1_delete(keys)
+            self._count('invalidations', len(keys))
+
+    def _sync(self, force=False):
+        """ Применяет к L1 новые записи журнала инвалидаций."""
+        tier = self._tier
+        now = time.monotonic()
+        if tier.pending_since is not None and (
+            now - tier.pending_since >= self._sync_interval
+        ):
+            self.publish_pending()
+        if not force and tier.synced_at is not None and (
+            now - tier.synced_at < self._sync_interval
+        ):
+            return
+        if not tier.sync_lock.acquire(blocking=force):
+            # Журнал уже читает другой поток
+            return
+        try:
+            head = self._l2.get(SEQUENCE_KEY, 0)
+            if tier.synced_at is None:
+                # Первое чтение журнала: в L1 пока только свои записи
+                pass
+            elif (
+                now - tier.synced_at > self._log_timeout
+                or not tier.seen <= head <= tier.seen + self._log_batch
+            ):
+                # Журнал очищен, процесс долго его не читал или сильно
+                # отстал - перечитывать нечего или слишком долго
+                self._l1_clear()
+            elif head > tier.seen:
+                self._apply_log(tier, head)
+            tier.seen = head
+            tier.synced_at = now
+            if tier.flushed_at is None or (
+                now - tier.flushed_at >= self._stats_interval
+            ):
+                self._flush_stats(tier)
+        finally:
+            tier.sync_lock.release()
+
+    # Счетчики по семействам ключей
+
+    def _flush_stats(self, tier):
+        """ Публикует в L2 снимок счетчиков процесса."""
+        reset = self._l2.get(STATS_RESET_KEY)
+        with tier.lock:
+            if reset != tier.reset_marker:
+                # Счетчики сбросили (reset_stats) в другом процессе
+                tier.families.clear()
+                tier.reset_marker = reset
+            snapshot = {
+                family: dict(counts)
+                for family, counts in tier.families.items()
+            }
+        self._l2.set(
+            STATS_KEY.format(tier.token), snapshot, self._stats_timeout
+        )
+        processes = self._l2.get(STATS_PROCESSES_KEY, set())
+        if tier.token not in processes:
+            # Гонка двух новых процессов может потерять один из них:
+            # он допишет себя при следующей публикации
+            self._l2.set(STATS_PROCESSES_KEY, processes | {tier.token}, None)
+        tier.flushed_at = time.monotonic()
+
+    def family_stats(self):
+        """ Попадания, промахи, записи, удаления, вытеснения из L1 и
+            время операций по семействам ключей, сложенные по всем
+            процессам. Процесс публикует свои счетчики раз в
+            STATS_INTERVAL секунд, поэтому свежие операции других
+            процессов могут войти в отчет с опозданием.
+        """
+        self._flush_stats(self._tier)
+        processes = self._l2.get(STATS_PROCESSES_KEY, set())
+        snapshots = self._l2.get_many(
+            [STATS_KEY.format(token) for token in processes]
+        )
+        if len(snapshots) < len(processes):
+            # Снимки умерших процессов истекли
+            self._l2.set(STATS_PROCESSES_KEY, {
+                token for token in processes
+                if STATS_KEY.format(token) in snapshots
+            }, None)
+        total = defaultdict(Counter)
+        for snapshot in snapshots.values():
+            for family, counts in snapshot.items():
+                total[family].update(counts)
+        return {family: dict(counts) for family, counts in total.items()}
+
+    def reset_stats(self):
+        """ Обнуляет счетчики family_stats во всех процессах."""
+        self._l2.set(STATS_RESET_KEY, uuid.uuid4().hex, None)
+        processes = self._l2.get(STATS_PROCESSES_KEY, set())
+        self._l2.delete_many(
+            [STATS_KEY.format(token) for token in processes]
+        )
+        self._l2.delete(STATS_PROCESSES_KEY)
+        self._flush_stats(self._tier)
+
+    def _at_exit(self, tier):
+        self.publish_pending()
+        self._flush_stats(tier)
+
+    def _publish(self, keys):
+        """ Запоминает, что ключи keys изменились: другим процессам
+            они будут сообщены одной записью журнала (publish_pending)."""
+        # Ключей L2_ONLY нет ни в чьем L1: сообщать о них незачем
+        keys = [key for key in keys if self._in_l1(key)]
+        if not keys:
+            return
+        tier = self._tier
+        with tier.lock:
+            tier.pending.update(keys)
+            if tier.pending_since is None:
+                tier.pending_since = time.monotonic()
+            due = len(tier.pending) >= self._log_keys or (
+                time.monotonic() - tier.pending_since >= self._sync_interval
+            )
+        if due:
+            self.publish_pending()
+
+    def publish_pending(self):
+        """ Записывает накопленные изменения в журнал инвалидаций.
+            Номер записи занимается через add, поэтому L2 должен
+            выполнять add атомарно для всех процессов (core.cache.FileCache,
+            Redis, Memcached; но не FileBasedCache): иначе два процесса
+            займут один номер и запись одного из них пропадет.
+        """
+        tier = self._tier
+        with tier.lock:
+            keys, tier.pending = tier.pending, set()
+            tier.pending_since = None
+        if not keys:
+            return
+        if CLEAR_ALL in keys:
+            keys = {CLEAR_ALL}
+        n = max(self._l2.get(SEQUENCE_KEY, 0), tier.seen) + 1
+        # add не перезаписывает чужую запись: занятый номер пропускаем
+        while not self._l2.add(
+            LOG_KEY.format(n), (tier.token, list(keys)), self._log_timeout
+        ):
+            n += 1
+        self._l2.set(SEQUENCE_KEY, n, None)
+        # Запись старше LOG_BATCH никто не прочтет (отставший процесс
+        # сбрасывает L1 целиком), поэтому журнал не копится в L2
+        self._l2.delete(LOG_KEY.format(n - self._log_batch - 1))
+
+    # Интерфейс BaseCache
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        started = time.perf_counter()
+        full_key = self._key(key, version)
+        # Ключа не было в L2, значит, в чужих L1 его тоже нет
+        timeout = self._timeout(timeout)
+        added = self._l2.add(
+            key, _wrap(value, timeout), timeout, version=version
+        )
+        if added:
+            self._l1_delete([full_key])
+        # Неудачный add - обычно занятая блокировка (core.single_flight)
+        self._record(started, [(full_key, 'sets' if added else 'conflicts')])
+        return added
+
+    def get(self, key, default=None, version=None):
+        started = time.perf_counter()
+        self._sync()
+        full_key = self._key(key, version)
+        value = self._l1_get(full_key)
+        if value is not _MISSING:
+            self._record(started, [(full_key, 'l1_hits')])
+            return value
+        stored = self._l2.get(key, _MISSING, version=version)
+        if stored is _MISSING:
+            self._count('l2_misses')
+            self._record(started, [(full_key, 'misses')])
+            return default
+        self._count('l2_hits')
+        value, ttl = _unwrap(stored)
+        self._l1_set(full_key, value, ttl)
+        self._record(started, [(full_key, 'l2_hits')])
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        started = time.perf_counter()
+        timeout = self._timeout(timeout)
+        full_key = self._key(key, version)
+        self._l2.set(key, _wrap(value, timeout), timeout, version=version)
+        self._publish([full_key])
+        self._l1_set(full_key, value, timeout)
+        self._record(started, [(full_key, 'sets')])
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        # Новый срок хранится и внутри записи, поэтому запись переписывается
+        timeout = self._timeout(timeout)
+        full_key = self._key(key, version)
+        stored = self._l2.get(key, _MISSING, version=version)
+        if stored is _MISSING:
+            return False
+        value, _ = _unwrap(stored)
+        self._l2.set(key, _wrap(value, timeout), timeout, version=version)
+        self._publish([full_key])
+        self._l1_delete([full_key])
+        return True
+
+    def delete(self, key, version=None):
+        started = time.perf_counter()
+        full_key = self._key(key, version)
+        result = self._l2.delete(key, version=version)
+        self._publish([full_key])
+        self._l1_delete([full_key])
+        self._record(started, [(full_key, 'deletes')])
+        return result
+
+    def get_many(self, keys, version=None):
+        started = time.perf_counter()
+        self._sync()
+        found = {}
+        missing = []
+        full_keys = {key: self._key(key, version) for key in keys}
+        for key, full_key in full_keys.items():
+            value = self._l1_get(full_key)
+            if value is _MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+        events = [(full_keys[key], 'l1_hits') for key in found]
+        if missing:
+            fetched = self._l2.get_many(missing, version=version)
+            self._count('l2_hits', len(fetched))
+            self._count('l2_misses', len(missing) - len(fetched))
+            for key, stored in fetched.items():
+                found[key], ttl = _unwrap(stored)
+                self._l1_set(full_keys[key], found[key], ttl)
+            events.extend(
+                (full_keys[key], 'l2_hits' if key in fetched else 'misses')
+                for key in missing
+            )
+        self._record(started, events)
+        return found
+
+    def has_key(self, key, version=None):
+        self._sync()
+        full_key = self._key(key, version)
+        tier = self._tier
+        with tier.lock:
+            entry = tier.entries.get(full_key)
+            if entry is not None and entry[1] > time.monotonic():
+                return True
+        return self._l2.has_key(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        started = time.perf_counter()
+        full_key = self._key(key, version)
+        stored = self._l2.get(key, _MISSING, version=version)
+        if stored is _MISSING:
+            raise ValueError(f"Key '{key}' not found")
+        value, ttl = _unwrap(stored)
+        value += delta
+        # Как и в BaseCache.incr, чтение и запись не атомарны;
+        # срок записи остается прежним
+        self._l2.set(key, _wrap(value, ttl), ttl, version=version)
+        self._publish([full_key])
+        self._l1_delete([full_key])
+        self._record(started, [(full_key, 'sets')])
+        return value
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        started = time.perf_counter()
+        timeout = self._timeout(timeout)
+        failed = self._l2.set_many(
+            {key: _wrap(value, timeout) for key, value in data.items()},
+            timeout, version=version
+        )
+        full_keys = {key: self._key(key, version) for key in data}
+        self._publish(full_keys.values())
+        for key, value in data.items():
+            if key not in failed:
+                self._l1_set(full_keys[key], value, timeout)
+        self._record(
+            started, [(full_key, 'sets') for full_key in full_keys.values()]
+        )
+        return failed
+
+    def delete_many(self, keys, version=None):
+        started = time.perf_counter()
+        keys = list(keys)
+        if not keys:
+            return
+        full_keys = [self._key(key, version) for key in keys]
+        self._l2.delete_many(keys, version=version)
+        self._publish(full_keys)
+        self._l1_delete(full_keys)
+        self._record(
+            started, [(full_key, 'deletes') for full_key in full_keys]
+        )
+
+    def clear(self):
+        self._l2.clear()
+        self._l1_clear()
+        self._publish([CLEAR_ALL])
+        self.publish_pending()
+
+    def stats(self):
+        """ Попадания и промахи по уровням в текущем процессе."""
+        tier = self._tier
+        with tier.lock:
+            stats = dict(tier.stats)
+            stats['l1_entries'] = len(tier.entries)
+        return stats
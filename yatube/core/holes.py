@@ -0,0 +1,73 @@
+import re
+from urllib.parse import parse_qsl, urlencode
+
+from django.http import HttpRequest
+from django.template.loader import render_to_string
+
+# Метка «дырки» в общем HTML страницы. Пользовательский текст
+# экранируется шаблонами, поэтому подделать метку нельзя
+HOLE_RE = re.compile(r'<!--hole:(?P<name>[\w.]+)\?(?P<params>[^<>]*)-->')
+
+_holes = {}
+
+
+def register(name, template_name):
+    """ Регистрирует «дырку» - небольшой кусок страницы, который зависит
+        от пользователя и рендерится в каждом запросе отдельно от
+        общей закэшированной части. Декорируемая функция получает
+        request и параметры метки и возвращает контекст для шаблона.
+    """
+    def decorator(func):
+        _holes[name] = (template_name, func)
+        return func
+    return decorator
+
+
+def punch(request):
+    """ Дальше страница рендерится как общая для всех: вместо «дырок»
+        в нее попадают метки (см. fill)."""
+    request._punch_holes = True
+
+
+def mend(request):
+    """ Дальше «дырки» снова рендерятся сразу: страница ошибки
+        не кэшируется, и меток в ней остаться не должно."""
+    request._punch_holes = False
+
+
+def is_punching(request):
+    return getattr(request, '_punch_holes', False)
+
+
+def guest_request():
+    """ Запрос гостя для шаблонов, которые рендерятся без запроса."""
+    from django.contrib.auth.models import AnonymousUser
+    request = HttpRequest()
+    request.user = AnonymousUser()
+    return request
+
+
+def marker(name, params):
+    return f'<!--hole:{name}?{urlencode(params)}-->'
+
+
+def render_hole(request, name, params):
+    template_name, get_context = _holes[name]
+    return render_to_string(
+        template_name, get_context(request, **params), request=request
+    )
+
+
+def fill(request, content):
+    """ Заменяет метки в общем HTML на куски для текущего пользователя."""
+    return HOLE_RE.sub(
+        lambda match: render_hole(
+            request, match['name'], dict(parse_qsl(match['params']))
+        ),
+        content
+    )
+
+
+@register('header', 'includes/header.html')
+def header(request):
+    return {}
@@ -0,0 +1,49 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+
+from core.cache import family_report
+
+
+def _ratio(value):
+    return '-' if value is None else f'{value:.0%}'
+
+
+def _ms(value):
+    return '-' if value is None else f'{value:.2f}'
+
+
+class Command(BaseCommand):
+    help = (
+        'Печатает счетчики кэша по семействам ключей (page, card, '
+        'timeline, sorl-thumbnail...), сложенные по всем процессам: '
+        'попадания (в том числе в L1), промахи, записи, удаления, '
+        'вытеснения из L1 и среднее время операции.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='Обнулить счетчики после вывода'
+        )
+
+    def handle(self, *args, **options):
+        if not hasattr(cache, 'family_stats'):
+            raise CommandError(
+                'Счетчики ведет только бэкенд core.cache.TieredCache'
+            )
+        self.stdout.write(
+            f'{"семейство":<20} {"попадания":>10} {"из L1":>8} '
+            f'{"промахи":>9} {"доля":>5} {"записи":>8} {"удаления":>9} '
+            f'{"вытеснено":>10} {"мс":>7}'
+        )
+        for row in family_report(cache.family_stats()):
+            self.stdout.write(
+                f'{row["family"]:<20} {row["hits"]:>10} '
+                f'{row["l1_hits"]:>8} {row["misses"]:>9} '
+                f'{_ratio(row["hit_ratio"]):>5} {row["sets"]:>8} '
+                f'{row["deletes"]:>9} {row["evictions"]:>10} '
+                f'{_ms(row["avg_ms"]):>7}'
+            )
+        if options['reset']:
+            cache.reset_stats()
+            self.stdout.write(self.style.SUCCESS('Счетчики обнулены'))
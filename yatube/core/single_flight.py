@@ -0,0 +1,105 @@
+import math
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+LOCK_KEY = 'single_flight:lock:{}'
+# Шаг ожидания чужой пересборки (секунды)
+WAIT_STEP = 0.05
+# Чем больше BETA, тем раньше начинается досрочное обновление
+BETA = 1.0
+
+
+def acquire(key):
+    """ Блокировка пересборки записи: True получит только один запрос.
+        Для всех процессов это верно, только если add кэша атомарен между
+        ними (core.cache.FileCache, Redis, Memcached; FileBasedCache -
+        нет): иначе запись изредка пересобирают два запроса сразу.
+    """
+    return cache.add(
+        LOCK_KEY.format(key), True, settings.SINGLE_FLIGHT_LOCK_TIMEOUT
+    )
+
+
+def release(key):
+    cache.delete(LOCK_KEY.format(key))
+
+
+def should_refresh(refresh_at, delta):
+    """ Досрочное вероятностное обновление (XFetch): чем ближе срок
+        записи и чем дольше она строится (delta), тем вероятнее, что
+        запрос возьмется за пересборку заранее. Так популярные записи
+        обновляются до истечения и не истекают все разом.
+    """
+    # 1 - random() лежит в (0, 1], логарифм от него определен
+    jitter = -delta * BETA * math.log(1.0 - random.random())
+    return time.time() + jitter >= refresh_at
+
+
+def envelope(value, timeout, delta):
+    """ Запись кэша: значение, момент обновления и время сборки."""
+    return value, time.time() + timeout, delta
+
+
+def stored_timeout(timeout):
+    # Запись живет в кэше дольше своего срока, чтобы ее можно было
+    # отдавать, пока один из запросов строит новую
+    return timeout + settings.SINGLE_FLIGHT_STALE_TIMEOUT
+
+
+def _rebuild(key, build, timeout, latest_key, cacheable):
+    try:
+        started = time.time()
+        value = build()
+        if cacheable is None or cacheable(value):
+            delta = time.time() - started
+            cache.set(
+                key, envelope(value, timeout, delta), stored_timeout(timeout)
+            )
+            if latest_key is not None:
+                cache.set(latest_key, value, timeout)
+        return value
+    finally:
+        release(key)
+
+
+def _wait(key):
+    deadline = time.monotonic() + settings.SINGLE_FLIGHT_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_STEP)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+    return None
+
+
+def get_or_build(key, build, timeout, latest_key=None, cacheable=None):
+    """ Значение из кэша или build(), но без «эффекта толпы»:
+        пересобирает запись только запрос, взявший блокировку,
+        остальные получают прежнюю копию.
+
+        latest_key - ключ последней собранной копии, не зависящий от
+        версии данных. Ее отдают, пока строится запись под новым
+        ключом key (например, после сброса версии страницы).
+        cacheable(value) - можно ли класть результат в кэш.
+        Если копии нет совсем, запрос ждет чужую пересборку не дольше
+        SINGLE_FLIGHT_WAIT секунд, а потом строит значение сам.
+    """
+    entry = cache.get(key)
+    if entry is not None:
+        value, refresh_at, delta = entry
+        if not should_refresh(refresh_at, delta) or not acquire(key):
+            return value
+        return _rebuild(key, build, timeout, latest_key, cacheable)
+    if acquire(key):
+        return _rebuild(key, build, timeout, latest_key, cacheable)
+    if latest_key is not None:
+        value = cache.get(latest_key)
+        if value is not None:
+            return value
+    entry = _wait(key)
+    if entry is not None:
+        return entry[0]
+    return build()
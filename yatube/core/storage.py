@@ -0,0 +1,55 @@
+import hashlib
+import os
+import re
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+# Имя файла в хранилище - хэш содержимого и расширение
+DIGEST_RE = re.compile(r'^[0-9a-f]{32}$')
+
+
+def file_digest(content):
+    """ Хэш содержимого файла (читается по частям)."""
+    digest = hashlib.blake2b(digest_size=16)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def content_digest(name):
+    """ Хэш из имени файла хранилища или None, если файл назван
+        не по содержимому (загружен до перехода на это хранилище)."""
+    stem = os.path.splitext(os.path.basename(name or ''))[0]
+    return stem if DIGEST_RE.match(stem) else None
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """ Файловое хранилище, в котором имя файла - хэш его содержимого:
+        posts/photo.jpg сохраняется как posts/3f/3fa2…c1.jpg.
+        Одинаковые загрузки хранятся одним файлом, и sorl строит для
+        них одни миниатюры. Существующий файл не перезаписывается;
+        удалять его можно, только когда на него не ссылается ни один
+        объект (счетчик ссылок ведет приложение, см. posts.counters).
+    """
+    def _save(self, name, content):
+        digest = file_digest(content)
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        name = os.path.join(directory, digest[:2], f'{digest}{extension}')
+        if self.exists(name):
+            # Свежая дата изменения защищает файл от сборщика мусора
+            # (media_gc), пока ссылка на него еще не записана в БД
+            os.utime(self.path(name))
+            return name
+        # Одинаковый файл могут сохранять одновременно: каждый пишет
+        # свою временную копию и переименовывает ее в итоговое имя.
+        # Содержимое у копий одно, поэтому неважно, чья останется
+        temporary = super()._save(f'{name}.{uuid.uuid4().hex}.tmp', content)
+        os.replace(self.path(temporary), self.path(name))
+        return name
+
+
+content_addressed_storage = ContentAddressedStorage()
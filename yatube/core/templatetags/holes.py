@@ -0,0 +1,23 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from core import holes
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def hole(context, name, **params):
+    """ Кусок страницы, зависящий от пользователя (см. core.holes).
+        В общей закэшированной странице на его месте остается метка,
+        иначе он рендерится сразу. Без запроса в контексте кусок
+        рендерится сразу для гостя.
+    """
+    request = getattr(context, 'request', None)
+    if request is None:
+        return mark_safe(
+            holes.render_hole(holes.guest_request(), name, params)
+        )
+    if holes.is_punching(request):
+        return mark_safe(holes.marker(name, params))
+    return mark_safe(holes.render_hole(request, name, params))
@@ -1,5 +1,27 @@
+import copy
+import operator
+import os
+import shutil
+import tempfile
+import threading
+import time
 from http import HTTPStatus
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.core.signals import request_finished
+from django.template import Context, Template, engines
 from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from . import background, single_flight
+from .warmup import warm_templates
+from .storage import ContentAddressedStorage, content_digest
+from .cache import (LOG_KEY, SEQUENCE_KEY, FileCache, TieredCache,
+                    family_report, key_family)
 
 
 @override_settings(DEBUG=False)
@@ -10,3 +32,380 @@ class ViewTestClass(TestCase):
         response = self.client.get('/nonexist-page/')
         self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
         self.assertTemplateUsed(response, 'core/404.html')
+
+    def test_error_page_of_cached_view_has_no_markers(self):
+        """ Страница 404 из кэшируемого представления рендерится
+            целиком, без меток «дырок»."""
+        response = self.client.get(
+            reverse('posts:profile', kwargs={'username': 'nobody'})
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+        self.assertNotIn('<!--hole:', response.content.decode())
+        self.assertContains(
+            response, 'Войти', status_code=HTTPStatus.NOT_FOUND
+        )
+
+    def test_hole_without_request(self):
+        """ Шаблон с «дыркой» рендерится и без запроса."""
+        html = Template("{% load holes %}{% hole 'header' %}").render(
+            Context()
+        )
+        self.assertIn('Войти', html)
+
+
+L2_CACHE = {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'tiered-test',
+}
+
+
+def tiered_cache(name, **options):
+    """ Экземпляр TieredCache; разные name ведут себя как L1 разных
+        процессов над общим L2."""
+    options = {'L2': 'shared', 'SYNC_INTERVAL': 0, **options}
+    return TieredCache(name, {'OPTIONS': options})
+
+
+@override_settings(CACHES={'default': L2_CACHE, 'shared': L2_CACHE})
+class TieredCacheTest(TestCase):
+    """ Класс проверяет двухуровневый кэш core.cache.TieredCache."""
+    def setUp(self):
+        caches['shared'].clear()
+
+    def test_reads_are_served_from_l1(self):
+        """ Повторное чтение не обращается к L2."""
+        first = tiered_cache('test-l1')
+        first.set('key', 'value')
+        caches['shared'].delete('key')
+        self.assertEqual(first.get('key'), 'value')
+        second = tiered_cache('test-l1-other')
+        self.assertIsNone(second.get('key'))
+        stats = first.stats()
+        self.assertEqual(stats['l1_hits'], 1)
+        self.assertEqual(second.stats()['l2_misses'], 1)
+
+    def test_writes_invalidate_other_processes(self):
+        """ Запись в одном процессе сбрасывает L1 в других."""
+        first = tiered_cache('test-writer')
+        second = tiered_cache('test-reader')
+        first.set_many({'a': 1, 'b': 2})
+        self.assertEqual(second.get_many(['a', 'b']), {'a': 1, 'b': 2})
+        first.set('a', 10)
+        first.delete('b')
+        self.assertEqual(second.get_many(['a', 'b']), {'a': 10})
+        self.assertEqual(second.stats()['invalidations'], 2)
+        second.get('a')
+        first.clear()
+        self.assertIsNone(second.get('a'))
+
+    def test_l2_only_keys_skip_l1(self):
+        """ Ключи L2_ONLY (сессии, пользователи) другие процессы
+            перестают видеть сразу после удаления."""
+        options = {'L2_ONLY': ['user:'], 'SYNC_INTERVAL': 60}
+        first = tiered_cache('test-auth-writer', **options)
+        second = tiered_cache('test-auth-reader', **options)
+        first.set_many({'user:1': 'alice', 'page:1': 'html'})
+        self.assertEqual(second.get('user:1'), 'alice')
+        self.assertEqual(second.get('page:1'), 'html')
+        first.delete_many(['user:1', 'page:1'])
+        self.assertIsNone(second.get('user:1'))
+        # обычный ключ дождется журнала в L1 второго процесса
+        self.assertEqual(second.get('page:1'), 'html')
+        self.assertEqual(second.stats()['l1_entries'], 1)
+
+    def test_writes_published_in_one_log_entry(self):
+        """ Изменения копятся и попадают в журнал одной записью
+            (в конце запроса), старые записи журнала удаляются."""
+        first = tiered_cache('test-batch-writer', SYNC_INTERVAL=60)
+        second = tiered_cache('test-batch-reader')
+        first.set_many({'a': 1, 'b': 2})
+        first.publish_pending()
+        self.assertEqual(second.get_many(['a', 'b']), {'a': 1, 'b': 2})
+        first.set('a', 10)
+        first.delete('b')
+        # До конца запроса другие процессы видят свою копию в L1
+        self.assertEqual(second.get_many(['a', 'b']), {'a': 1, 'b': 2})
+        shared = caches['shared']
+        sequence = shared.get(SEQUENCE_KEY)
+        request_finished.send(sender=None)
+        entries = shared.get_many([
+            LOG_KEY.format(n)
+            for n in range(sequence + 1, shared.get(SEQUENCE_KEY) + 1)
+        ]).values()
+        self.assertEqual(
+            [sorted(keys) for token, keys in entries
+             if token == first._tier.token],
+            [sorted(first.make_key(key) for key in 'ab')]
+        )
+        self.assertEqual(second.get_many(['a', 'b']), {'a': 10})
+        ring = tiered_cache('test-log-ring', LOG_BATCH=2, SYNC_INTERVAL=0)
+        for i in range(5):
+            ring.set('key', i)
+        head = shared.get(SEQUENCE_KEY)
+        self.assertIsNone(shared.get(LOG_KEY.format(head - 3)))
+        self.assertIsNotNone(shared.get(LOG_KEY.format(head - 2)))
+
+    def test_l1_does_not_outlive_l2(self):
+        """ Копия в L1 живет не дольше, чем запись в L2."""
+        first = tiered_cache('test-ttl-writer')
+        second = tiered_cache('test-ttl-reader')
+        first.set('key', 'value', 0.2)
+        self.assertEqual(second.get('key'), 'value')
+        time.sleep(0.3)
+        self.assertIsNone(second.get('key'))
+        first.set('counter', 1, 0.2)
+        self.assertEqual(first.incr('counter'), 2)
+        time.sleep(0.3)
+        self.assertIsNone(second.get('counter'))
+
+    def test_l1_is_bounded(self):
+        """ L1 вытесняет давно не читанные записи и истекает по времени."""
+        small = tiered_cache('test-lru', MAX_ENTRIES=2)
+        for key in ('a', 'b', 'c'):
+            small.set(key, key)
+        self.assertEqual(small.stats()['l1_entries'], 2)
+        short = tiered_cache('test-ttl', L1_TIMEOUT=0)
+        short.set('key', 'value')
+        self.assertEqual(short.get('key'), 'value')
+        self.assertEqual(short.stats().get('l1_hits', 0), 0)
+        self.assertEqual(short.stats()['l2_hits'], 1)
+
+    def test_family_stats(self):
+        """ Счетчики по семействам ключей складываются по процессам
+            и обнуляются во всех процессах."""
+        self.assertEqual(key_family('sorl-thumbnail||image||abc'),
+                         'sorl-thumbnail')
+        self.assertEqual(key_family('page:index:abc:1.2'), 'page:index')
+        self.assertEqual(key_family('single_flight:lock:page:index:abc'),
+                         'single_flight:page:index')
+        self.assertEqual(key_family('single_flight:lock:card:1'),
+                         'single_flight:card')
+        first = tiered_cache('test-stats', MAX_ENTRIES=1)
+        second = tiered_cache('test-stats-other')
+        first.set_many({'page:index:a': 1, 'page:index:b': 2})
+        first.get('page:index:b')
+        second.get('page:index:a')
+        second.get('card:1')
+        # отчет публикует счетчики своего процесса
+        first.family_stats()
+        stats = second.family_stats()
+        self.assertEqual(stats['page:index']['sets'], 2)
+        self.assertEqual(stats['page:index']['evictions'], 1)
+        self.assertEqual(stats['page:index']['l1_hits'], 1)
+        self.assertEqual(stats['page:index']['l2_hits'], 1)
+        self.assertEqual(stats['card']['misses'], 1)
+        rows = {row['family']: row for row in family_report(stats)}
+        self.assertEqual(rows['page:index']['hit_ratio'], 1)
+        self.assertEqual(rows['card']['hit_ratio'], 0)
+        first.reset_stats()
+        self.assertEqual(second.family_stats(), {})
+
+
+class FileCacheTest(TestCase):
+    """ Класс проверяет файловый L2 core.cache.FileCache."""
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.location, ignore_errors=True)
+
+    def file_cache(self, **options):
+        # Свой экземпляр со своим файлом блокировки - как в другом процессе
+        return FileCache(self.location, {'OPTIONS': options})
+
+    def test_add_is_atomic(self):
+        """ Из одновременных add одного ключа успешен ровно один,
+            просроченный ключ можно занять снова."""
+        workers = 16
+        barrier = threading.Barrier(workers)
+        results = []
+
+        def add():
+            backend = self.file_cache()
+            barrier.wait()
+            results.append(backend.add('lock', True, 60))
+
+        threads = [threading.Thread(target=add) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(True), 1)
+        backend = self.file_cache()
+        backend.set('lock', True, -1)
+        self.assertFalse(backend.has_key('lock'))
+        self.assertTrue(backend.add('lock', True, 60))
+
+    def test_cull_is_throttled(self):
+        """ Каталог перебирается не на каждую запись."""
+        backend = self.file_cache(CULL_EVERY=10)
+        with mock.patch.object(
+            FileCache, '_list_cache_files', return_value=[]
+        ) as listed:
+            for n in range(25):
+                backend.set(f'key:{n}', n)
+        self.assertEqual(listed.call_count, 2)
+
+
+class CacheMetricsTest(TestCase):
+    """ Класс проверяет страницу счетчиков кэша."""
+    def test_metrics_for_staff_only(self):
+        """ Счетчики видны только сотрудникам."""
+        url = reverse('core:cache_metrics')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+        staff = get_user_model().objects.create_user(
+            username='staff', is_staff=True
+        )
+        self.client.force_login(staff)
+        cache.get('page:metrics')
+        response = self.client.get(url)
+        families = {row['family'] for row in response.json()['families']}
+        self.assertIn('page:metrics', families)
+        self.assertIn('session', families)
+
+
+class SingleFlightTest(TestCase):
+    """ Класс проверяет защиту от одновременной пересборки кэша."""
+    def setUp(self):
+        cache.clear()
+
+    def build(self):
+        self.builds += 1
+        return f'value {self.builds}'
+
+    def test_one_request_rebuilds(self):
+        """ Пока запись строит другой запрос, отдается прежняя копия."""
+        self.builds = 0
+        self.assertEqual(
+            single_flight.get_or_build('key', self.build, 60), 'value 1'
+        )
+        self.assertEqual(
+            single_flight.get_or_build('key', self.build, 60), 'value 1'
+        )
+        # срок записи вышел, но блокировку держит другой запрос
+        cache.set('key', single_flight.envelope('old', -1, 0))
+        self.assertTrue(single_flight.acquire('key'))
+        self.assertEqual(
+            single_flight.get_or_build('key', self.build, 60), 'old'
+        )
+        single_flight.release('key')
+        self.assertEqual(
+            single_flight.get_or_build('key', self.build, 60), 'value 2'
+        )
+        self.assertEqual(self.builds, 2)
+
+    def test_latest_copy_served_while_building(self):
+        """ Для нового ключа без копии отдается последняя версия."""
+        self.builds = 0
+        single_flight.get_or_build('key:1', self.build, 60, 'key:latest')
+        self.assertTrue(single_flight.acquire('key:2'))
+        self.assertEqual(
+            single_flight.get_or_build(
+                'key:2', self.build, 60, 'key:latest'
+            ),
+            'value 1'
+        )
+        self.assertEqual(self.builds, 1)
+
+    @override_settings(CACHES={
+        'default': {
+            'BACKEND': 'core.cache.TieredCache',
+            'OPTIONS': {'L2': 'shared'},
+        },
+        'shared': {
+            'BACKEND': 'core.cache.FileCache',
+            'LOCATION': os.path.join(
+                tempfile.gettempdir(), 'yatube_test_single_flight'
+            ),
+        },
+    })
+    def test_lock_with_file_cache(self):
+        """ Блокировку в общем файловом кэше берет один запрос
+            из одновременных."""
+        caches['shared'].clear()
+        workers = 8
+        barrier = threading.Barrier(workers)
+        results = []
+
+        def acquire():
+            barrier.wait()
+            results.append(single_flight.acquire('key'))
+
+        threads = [threading.Thread(target=acquire) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(True), 1)
+        single_flight.release('key')
+        self.assertTrue(single_flight.acquire('key'))
+        single_flight.release('key')
+
+    def test_early_refresh(self):
+        """ Досрочное обновление не наступает задолго до срока
+            и обязательно после него."""
+        now = time.time()
+        self.assertFalse(single_flight.should_refresh(now + 3600, 0.01))
+        self.assertTrue(single_flight.should_refresh(now - 1, 0.01))
+
+
+class BackgroundTest(TestCase):
+    """ Класс проверяет общий пул фоновых задач."""
+    def test_tasks_share_bounded_pool(self):
+        """ Задачи выполняются в одном пуле с ограниченным числом
+            потоков, ошибка задачи попадает в журнал."""
+        done = threading.Event()
+        with mock.patch.object(background, 'is_available',
+                               return_value=True):
+            with self.assertLogs('core.background', 'ERROR'):
+                background.submit('test', 1, operator.truediv, 1, 0)
+                background.submit('test', 1, done.set)
+                self.assertTrue(done.wait(5))
+        self.assertEqual(background._pool('test', 1)._max_workers, 1)
+
+    def test_sqlite_runs_inline(self):
+        """ С SQLite задача выполняется сразу в потоке запроса."""
+        threads = []
+        background.submit('test', 1, lambda: threads.append(
+            threading.current_thread()
+        ))
+        self.assertEqual(threads, [threading.current_thread()])
+
+
+class TemplateWarmupTest(TestCase):
+    """ Класс проверяет компиляцию шаблонов при запуске."""
+    def test_templates_are_cached(self):
+        """ Все шаблоны проекта попадают в cached.Loader."""
+        templates = copy.deepcopy(settings.TEMPLATES)
+        # Без DEBUG Django сам берет шаблоны через cached.Loader
+        templates[0]['OPTIONS']['debug'] = False
+        with self.settings(TEMPLATES=templates):
+            names = warm_templates()
+            loader = engines['django'].engine.template_loaders[0]
+            self.assertTrue(set(names) <= set(loader.get_template_cache))
+        self.assertIn('base.html', names)
+        self.assertIn('posts/index.html', names)
+
+
+class ContentAddressedStorageTest(TestCase):
+    """ Класс проверяет хранилище файлов с именами по содержимому."""
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.storage = ContentAddressedStorage(location=self.location)
+
+    def tearDown(self):
+        shutil.rmtree(self.location, ignore_errors=True)
+
+    def test_concurrent_identical_uploads(self):
+        """ Одинаковые файлы, сохраняемые одновременно (файл появился
+            уже после проверки exists), остаются одним файлом."""
+        with mock.patch.object(self.storage, 'exists', return_value=False):
+            names = [
+                self.storage.save('posts/photo.gif', ContentFile(b'GIF89a'))
+                for _ in range(2)
+            ]
+        self.assertEqual(names[0], names[1])
+        self.assertIsNotNone(content_digest(names[0]))
+        directory = os.path.dirname(self.storage.path(names[0]))
+        self.assertEqual(os.listdir(directory), [os.path.basename(names[0])])
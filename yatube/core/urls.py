@@ -0,0 +1,11 @@
+from django.urls import path
+
+from . import views
+
+app_name = 'core'
+
+
+urlpatterns = [
+    # Счетчики кэша для сотрудников (JSON)
+    path('cache/', views.cache_metrics, name='cache_metrics'),
+]
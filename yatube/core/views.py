@@ -1,5 +1,10 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.cache import cache
+from django.http import Http404, JsonResponse
 from django.shortcuts import render
 
+from .cache import family_report
+
 
 def page_not_found(request, exception):
     # Переменная exception содержит отладочную информацию;
@@ -17,3 +22,11 @@ def permission_denied(request, reason=''):
 
 def server_error(request):
     return render(request, 'core/500.html', status=500)
+
+
+@staff_member_required
+def cache_metrics(request):
+    """ Счетчики кэша по семействам ключей (см. TieredCache.family_stats)."""
+    if not hasattr(cache, 'family_stats'):
+        raise Http404('Счетчики ведет только core.cache.TieredCache')
+    return JsonResponse({'families': family_report(cache.family_stats())})
@@ -0,0 +1,28 @@
+import os
+
+from django.template import engines
+
+
+def template_names(directory):
+    """ Имена всех шаблонов в папке (как их передают в get_template)."""
+    for root, _, files in os.walk(directory):
+        for filename in files:
+            if filename.endswith('.html'):
+                path = os.path.join(root, filename)
+                yield os.path.relpath(path, directory).replace(os.sep, '/')
+
+
+def warm_templates():
+    """ Компилирует все шаблоны проекта (TEMPLATES['DIRS']) заранее:
+        cached.Loader держит их в памяти, и первый запрос к странице
+        не тратит время на разбор шаблонов. Ошибка в шаблоне
+        обнаружится при запуске, а не на странице. Вызывается
+        при запуске сервера (yatube.wsgi), если DEBUG выключен.
+    """
+    engine = engines['django'].engine
+    names = []
+    for directory in engine.dirs:
+        for name in sorted(template_names(directory)):
+            engine.get_template(name)
+            names.append(name)
+    return names
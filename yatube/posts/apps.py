@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class PostsConfig(AppConfig):
     name = 'posts'
+
+    def ready(self):
+        # Подключаем обработчики сигналов моделей
+        # и регистрируем «дырки» страниц (core.holes)
+        from . import holes, signals  # noqa: F401
@@ -0,0 +1,82 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+
+from core import single_flight
+
+from . import thumbnails
+
+CARD_TEMPLATE = 'posts/includes/current_post.html'
+# Сколько ключей удалять из кэша за один вызов
+DELETE_BATCH_SIZE = 500
+
+
+def card_key(post_id):
+    """ Ключ кэша карточки поста. Версия меняется вместе с шаблоном."""
+    return f'post_card:{settings.POST_CARD_VERSION}:{post_id}'
+
+
+def _render(posts_by_key):
+    """ Рендерит карточки. Варианты картинок всех карточек берутся
+        из хранилища sorl разом (posts.thumbnails.image_variants)."""
+    variants = thumbnails.image_variants(posts_by_key.values())
+    rendered = {}
+    for key, post in posts_by_key.items():
+        started = time.time()
+        html = render_to_string(
+            CARD_TEMPLATE,
+            {'post': post, 'image_variants': variants.get(post.pk)}
+        )
+        rendered[key] = single_flight.envelope(
+            html, settings.POST_CARD_TIMEOUT, time.time() - started
+        )
+    return rendered
+
+
+def render_cards(posts):
+    """ Возвращает HTML карточек постов в том же порядке.
+        Готовые карточки берутся из кэша одним get_many,
+        недостающие рендерятся и кладутся в кэш одним set_many.
+        Карточку, которой пора обновиться (см. single_flight),
+        перерисовывает один запрос, остальные отдают прежнюю.
+    """
+    keys = [card_key(post.pk) for post in posts]
+    cached = cache.get_many(keys)
+    cards = {}
+    stale = {}
+    locked = []
+    try:
+        for key, post in zip(keys, posts):
+            entry = cached.get(key)
+            if entry is not None:
+                html, refresh_at, delta = entry
+                if not single_flight.should_refresh(refresh_at, delta) or (
+                    not single_flight.acquire(key)
+                ):
+                    cards[key] = html
+                    continue
+                locked.append(key)
+            stale[key] = post
+        if stale:
+            rendered = _render(stale)
+            cache.set_many(
+                rendered,
+                single_flight.stored_timeout(settings.POST_CARD_TIMEOUT)
+            )
+            cards.update((key, entry[0]) for key, entry in rendered.items())
+    finally:
+        for key in locked:
+            single_flight.release(key)
+    return [cards[key] for key in keys]
+
+
+def invalidate_cards(post_ids):
+    """ Удаляет из кэша карточки постов."""
+    post_ids = list(post_ids)
+    for start in range(0, len(post_ids), DELETE_BATCH_SIZE):
+        cache.delete_many([
+            card_key(post_id)
+            for post_id in post_ids[start:start + DELETE_BATCH_SIZE]
+        ])
@@ -0,0 +1,135 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from core.storage import content_digest
+
+from .models import Counter, Post
+
+TOTAL_POSTS = 'posts:total'
+IMAGE_COUNTER_PREFIX = 'posts:image:'
+
+
+def counter_name(author_id=None, group_id=None):
+    """ Имя счетчика постов: всего, у автора или в группе."""
+    if author_id is not None:
+        return f'posts:author:{author_id}'
+    if group_id is not None:
+        return f'posts:group:{group_id}'
+    return TOTAL_POSTS
+
+
+def image_counter_name(image_name):
+    """ Имя счетчика постов с данным файлом картинки (число ссылок
+        на файл, см. core.storage) или None для файла, названного
+        не по содержимому."""
+    if content_digest(image_name) is None:
+        return None
+    return f'{IMAGE_COUNTER_PREFIX}{image_name}'
+
+
+def counted_posts(name):
+    """ Посты, которые считает счетчик с данным именем."""
+    _, kind, *pk = name.split(':')
+    if kind == 'author':
+        return Post.objects.filter(author_id=pk[0])
+    if kind == 'group':
+        return Post.objects.filter(group_id=pk[0])
+    if kind == 'image':
+        return Post.objects.filter(image=pk[0])
+    return Post.objects.all()
+
+
+def recount(name):
+    """ Пересчитывает счетчик по таблице постов и сохраняет значение."""
+    value = counted_posts(name).count()
+    try:
+        with transaction.atomic():
+            Counter.objects.update_or_create(
+                name=name, defaults={'value': value}
+            )
+    except IntegrityError:
+        # Счетчик параллельно создан другим запросом
+        Counter.objects.filter(name=name).update(value=value)
+    return value
+
+
+def get_posts_count(author_id=None, group_id=None):
+    """ Число постов из таблицы счетчиков (без COUNT по постам)."""
+    return _get(counter_name(author_id, group_id))
+
+
+def get_image_refs(image_name):
+    """ Число постов, ссылающихся на файл картинки (для файла,
+        названного не по содержимому, - None: ссылки не считаются)."""
+    name = image_counter_name(image_name)
+    return None if name is None else _get(name)
+
+
+def unreferenced_images(after='', limit=500):
+    """ Имена файлов картинок, на которые по счетчикам не ссылается
+        ни один пост: не больше limit, по имени после after."""
+    names = Counter.objects.filter(
+        name__startswith=IMAGE_COUNTER_PREFIX,
+        name__gt=image_counter_name(after) if after else IMAGE_COUNTER_PREFIX,
+        value=0,
+    ).order_by('name').values_list('name', flat=True)[:limit]
+    return [name[len(IMAGE_COUNTER_PREFIX):] for name in names]
+
+
+def forget_images(image_names):
+    """ Удаляет нулевые счетчики ссылок на удаленные файлы картинок."""
+    Counter.objects.filter(
+        name__in=[image_counter_name(name) for name in image_names],
+        value=0,
+    ).delete()
+
+
+def _get(name):
+    value = Counter.objects.filter(
+        name=name
+    ).values_list('value', flat=True).first()
+    if value is None:
+        value = recount(name)
+    return value
+
+
+def change(name, delta):
+    """ Изменяет счетчик на delta одним UPDATE.
+        Если счетчика нет или он ушел бы в минус (значит, разошелся
+        с данными), он пересчитывается целиком.
+    """
+    updated = Counter.objects.filter(
+        name=name, value__gte=-delta
+    ).update(value=F('value') + delta)
+    if not updated:
+        recount(name)
+
+
+def post_changed(post, delta, group_id=None):
+    """ Учитывает появление (delta=1) или удаление (delta=-1) поста."""
+    change(TOTAL_POSTS, delta)
+    change(counter_name(author_id=post.author_id), delta)
+    if group_id is not None:
+        change(counter_name(group_id=group_id), delta)
+
+
+def image_changed(old_name, new_name):
+    """ Переносит ссылку поста со старого файла картинки на новый.
+        Счетчика нового файла обычно еще нет: он создается сразу
+        со значением по индексу картинок (после сохранения поста).
+    """
+    if old_name == new_name:
+        return
+    for name, delta in ((old_name, -1), (new_name, 1)):
+        counter = image_counter_name(name)
+        if counter is not None:
+            change(counter, delta)
+
+
+def largest(kind, limit):
+    """ id авторов (kind='author') или групп (kind='group')
+        с наибольшим числом постов - по таблице счетчиков."""
+    names = Counter.objects.filter(
+        name__startswith=f'posts:{kind}:'
+    ).order_by('-value').values_list('name', flat=True)[:limit]
+    return [int(name.rsplit(':', 1)[1]) for name in names]
@@ -0,0 +1,62 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Follow
+
+# Множество хранится под версией: подписка или отписка заводит
+# новую версию, и множество, прочитанное из БД до записи и положенное
+# в кэш уже после нее, больше никому не попадется
+FOLLOWS_KEY = 'follows:{}:{}'
+FOLLOWS_VERSION_KEY = 'follows:version:{}'
+
+
+def followed_key(user_id):
+    """ Ключ множества текущей версии."""
+    version_key = FOLLOWS_VERSION_KEY.format(user_id)
+    version = cache.get(version_key)
+    if version is None:
+        version = uuid.uuid4().hex[:12]
+        if not cache.add(version_key, version, None):
+            version = cache.get(version_key, version)
+    return FOLLOWS_KEY.format(user_id, version)
+
+
+def followed_authors(user_id):
+    """ Множество id авторов, на которых подписан пользователь.
+        Читается из БД один раз и хранится в кэше, поэтому проверка
+        «подписан ли на автора» для любого числа авторов страницы
+        не требует запросов.
+    """
+    key = followed_key(user_id)
+    authors = cache.get(key)
+    if authors is None:
+        authors = frozenset(
+            Follow.objects.filter(
+                user_id=user_id
+            ).values_list('author_id', flat=True)
+        )
+        cache.set(key, authors, settings.FOLLOW_SET_TIMEOUT)
+    return authors
+
+
+def is_following(user, author_id):
+    return user.is_authenticated and author_id in followed_authors(user.pk)
+
+
+def forget(user_id):
+    """ Сбрасывает множество после подписки или отписки: заводит
+        новую версию сразу (для чтений в той же транзакции) и еще раз
+        после фиксации транзакции - иначе множество, прочитанное
+        другим запросом до фиксации, осталось бы в кэше.
+        Множество не правят на месте: две одновременные правки через
+        get/set потеряли бы одну из них.
+    """
+    def bump():
+        cache.set(
+            FOLLOWS_VERSION_KEY.format(user_id), uuid.uuid4().hex[:12], None
+        )
+    bump()
+    transaction.on_commit(bump)
@@ -1,6 +1,7 @@
 from django import forms
 
 from .models import Post, Comment
+from .uploads import normalize_image
 
 
 class PostForm(forms.ModelForm):
@@ -13,6 +14,15 @@ class PostForm(forms.ModelForm):
             'group': 'Группа, к которой будет относиться пост'
         }
 
+    def clean_image(self):
+        """ Новая картинка уменьшается, поворачивается по EXIF
+            и очищается от метаданных (posts.uploads)."""
+        image = self.cleaned_data.get('image')
+        # Без новой загрузки здесь прежний файл поста или False
+        if not hasattr(image, 'content_type'):
+            return image
+        return normalize_image(image)
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,29 @@
+from core import holes
+
+from .follows import is_following
+from .forms import CommentForm
+
+
+@holes.register('switcher', 'posts/includes/switcher.html')
+def switcher(request):
+    return {}
+
+
+@holes.register('follow_button', 'posts/includes/follow_button.html')
+def follow_button(request, author_id, username):
+    author_id = int(author_id)
+    return {
+        'author_id': author_id,
+        'username': username,
+        'following': is_following(request.user, author_id),
+    }
+
+
+@holes.register('comment_form', 'posts/includes/comment_form.html')
+def comment_form(request, post_id):
+    return {'post_id': int(post_id), 'form': CommentForm()}
+
+
+@holes.register('edit_link', 'posts/includes/edit_link.html')
+def edit_link(request, post_id, author_id):
+    return {'post_id': int(post_id), 'author_id': int(author_id)}
@@ -0,0 +1,42 @@
+from sorl.thumbnail.conf import settings
+from sorl.thumbnail.images import deserialize_image_file
+from sorl.thumbnail.kvstores import cached_db_kvstore
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+
+class KVStore(cached_db_kvstore.KVStore):
+    """ Хранилище ключей sorl (cached_db), которое умеет читать
+        много миниатюр сразу (settings.THUMBNAIL_KVSTORE)."""
+
+    def get_many(self, image_files):
+        """ Список ImageFile из хранилища (None - файла в нем нет)
+            в порядке image_files: одним get_many кэша и одним
+            запросом к таблице хранилища для промахов."""
+        keys = [add_prefix(image_file.key) for image_file in image_files]
+        values = self._get_many_raw(set(keys))
+        return [
+            deserialize_image_file(values[key]) if key in values else None
+            for key in keys
+        ]
+
+    def _get_many_raw(self, keys):
+        # Промахи запоминаются в кэше, как в _get_raw
+        values = self.cache.get_many(keys)
+        missing = [key for key in keys if key not in values]
+        if missing:
+            stored = dict(
+                KVStoreModel.objects.filter(
+                    key__in=missing
+                ).values_list('key', 'value')
+            )
+            fetched = {
+                key: stored.get(key, cached_db_kvstore.EMPTY_VALUE)
+                for key in missing
+            }
+            self.cache.set_many(fetched, settings.THUMBNAIL_CACHE_TIMEOUT)
+            values.update(fetched)
+        return {
+            key: value for key, value in values.items()
+            if value != cached_db_kvstore.EMPTY_VALUE
+        }
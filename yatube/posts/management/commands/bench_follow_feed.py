@@ -0,0 +1,72 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from posts.models import Post, User
+from posts.paginators import KeysetPaginator
+from posts.timeline import TimelinePaginator
+
+
+def measure(paginator, pages, repeat):
+    """ Лучшее время (мс) выборки страницы с номером pages по курсорам."""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        page = paginator.get_cursor_page()
+        for _ in range(pages - 1):
+            if page.next_cursor is None:
+                break
+            page = paginator.get_cursor_page(after=page.next_cursor)
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает время чтения ленты подписок через join по Follow '
+        'и через материализованную ленту Inbox. Закэшированное начало '
+        'ленты не используется: каждый замер читает диапазон Inbox.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'usernames',
+            nargs='*',
+            help='Пользователи для замера (по умолчанию - самые подписанные)'
+        )
+        parser.add_argument('--users', type=int, default=5)
+        parser.add_argument(
+            '--pages', type=int, default=1,
+            help='Сколько страниц пролистать от начала ленты'
+        )
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        users = User.objects.all()
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+        else:
+            users = users.annotate(
+                follows=Count('follower')
+            ).filter(follows__gt=0).order_by('-follows')[:options['users']]
+        per_page = settings.PAGINATION_COUNT
+        self.stdout.write(
+            f'{"пользователь":<20}{"join, мс":>12}{"inbox, мс":>12}'
+        )
+        for user in users:
+            # Обе стороны загружают посты одинаково (for_feed)
+            posts = Post.objects.filter(
+                author__following__user=user
+            ).for_feed()
+            join = KeysetPaginator(posts, per_page)
+            inbox = TimelinePaginator(
+                posts, per_page, user=user, use_head=False
+            )
+            join_ms = measure(join, options['pages'], options['repeat'])
+            inbox_ms = measure(inbox, options['pages'], options['repeat'])
+            self.stdout.write(
+                f'{user.username:<20}{join_ms:>12.2f}{inbox_ms:>12.2f}'
+            )
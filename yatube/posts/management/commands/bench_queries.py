@@ -0,0 +1,233 @@
+import random
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from posts.follows import followed_authors
+from posts.models import Comment, Follow, Group, Inbox, Post, User
+from posts.paginators import seek_queryset
+from posts.timeline import pulled_authors
+
+BENCH_PREFIX = 'bench_'
+# Метка в тексте постов и комментариев, созданных для замеров
+BENCH_TEXT = f'[{BENCH_PREFIX}]'
+
+
+class Command(BaseCommand):
+    help = (
+        'Печатает EXPLAIN QUERY PLAN и время запросов каждой страницы '
+        'с постами. С флагом --seed сначала дополняет базу тестовыми '
+        f'данными (пользователи и группы с префиксом {BENCH_PREFIX}, '
+        f'посты и комментарии с меткой {BENCH_TEXT} в тексте). '
+        'Заполняется только отдельная база, где нет других '
+        'пользователей (например, DATABASE_NAME=bench.sqlite3).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed', action='store_true',
+            help='Дополнить базу тестовыми данными до нужного объема'
+        )
+        parser.add_argument('--posts', type=int, default=1_000_000)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=50)
+        parser.add_argument(
+            '--follows', type=int, default=50,
+            help='Подписок на одного пользователя'
+        )
+        parser.add_argument(
+            '--comments', type=int, default=200_000,
+        )
+        parser.add_argument(
+            '--inbox', action='store_true',
+            help='После заполнения пересобрать ленты подписок (долго)'
+        )
+        parser.add_argument('--batch', type=int, default=10_000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument(
+            '--random-seed', type=int, default=1,
+            help='Зерно генератора, чтобы набор данных был воспроизводимым'
+        )
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['random_seed'])
+        if options['seed']:
+            self.check_bench_database()
+            self.seed(rnd, options)
+        self.stdout.write(f'Постов в базе: {Post.objects.count()}')
+        for title, queryset in self.queries():
+            self.report(title, queryset, options['repeat'])
+
+    def check_bench_database(self):
+        """ Миллион постов не должен попасть в рабочую базу: заполнять
+            можно только базу, где все пользователи созданы для замеров.
+        """
+        if User.objects.exclude(username__startswith=BENCH_PREFIX).exists():
+            raise CommandError(
+                'В базе есть пользователи не из замеров. Заполните '
+                'отдельную базу: DATABASE_NAME=bench.sqlite3 python3 '
+                'manage.py migrate, затем --seed с тем же DATABASE_NAME.'
+            )
+
+    def seed(self, rnd, options):
+        """ Дополняет базу пользователями, группами, подписками,
+            постами и комментариями. Сигналы при bulk_create не работают,
+            поэтому в конце пересчитываются счетчики (и, по желанию, ленты).
+        """
+        batch = options['batch']
+        users = list(User.objects.filter(
+            username__startswith=BENCH_PREFIX
+        ).values_list('pk', flat=True))
+        User.objects.bulk_create(
+            User(username=f'{BENCH_PREFIX}{i}')
+            for i in range(len(users), options['users'])
+        )
+        users = list(User.objects.filter(
+            username__startswith=BENCH_PREFIX
+        ).values_list('pk', flat=True))
+        existing = Group.objects.filter(slug__startswith=BENCH_PREFIX).count()
+        Group.objects.bulk_create(
+            Group(
+                title=f'Группа {i}', slug=f'{BENCH_PREFIX}{i}',
+                description='Группа для замеров'
+            ) for i in range(existing, options['groups'])
+        )
+        groups = list(Group.objects.filter(
+            slug__startswith=BENCH_PREFIX
+        ).values_list('pk', flat=True))
+        if not Follow.objects.filter(user__in=users).exists():
+            Follow.objects.bulk_create(
+                (
+                    Follow(user_id=user_id, author_id=author_id)
+                    for user_id in users
+                    for author_id in rnd.sample(
+                        users, min(options['follows'], len(users))
+                    )
+                    if author_id != user_id
+                )
+            )
+        self.seed_posts(rnd, users, groups, options['posts'], batch)
+        # Комментируют в основном свежие посты
+        recent = list(Post.objects.values_list('pk', flat=True)[:batch])
+        missing = options['comments'] - Comment.objects.count()
+        for start in range(0, max(missing, 0), batch):
+            Comment.objects.bulk_create(
+                Comment(
+                    post_id=rnd.choice(recent),
+                    author_id=rnd.choice(users),
+                    text=f'{BENCH_TEXT} Комментарий для замеров'
+                ) for _ in range(min(batch, missing - start))
+            )
+        call_command('recount', stdout=self.stdout)
+        if options['inbox']:
+            call_command('rebuild_inboxes', stdout=self.stdout)
+
+    def seed_posts(self, rnd, users, groups, total, batch):
+        # Даты публикации раскладываем на год назад: auto_now_add
+        # на время вставки отключаем, иначе все посты получат «сейчас»
+        pub_date = Post._meta.get_field('pub_date')
+        pub_date.auto_now_add = False
+        now = timezone.now()
+        try:
+            while True:
+                missing = total - Post.objects.count()
+                if missing <= 0:
+                    break
+                with transaction.atomic():
+                    Post.objects.bulk_create(
+                        Post(
+                            author_id=rnd.choice(users),
+                            group_id=rnd.choice(groups + [None]),
+                            text=f'{BENCH_TEXT} Пост для замеров',
+                            pub_date=now - timedelta(
+                                seconds=rnd.randint(0, 365 * 24 * 3600)
+                            )
+                        ) for _ in range(min(batch, missing))
+                    )
+                self.stdout.write(f'Создано постов: {total - missing}')
+        finally:
+            pub_date.auto_now_add = True
+
+    def queries(self):
+        """ Запросы, которые выполняют страницы проекта
+            (те же querysets, что строят представления)."""
+        per_page = settings.PAGINATION_COUNT + 1
+        keys = ('pub_date', 'id')
+        posts = Post.objects.for_feed()
+        middle = Post.objects.order_by('-pub_date', '-id').values_list(
+            'pub_date', 'id'
+        )[Post.objects.count() // 2:][:1]
+        user = User.objects.filter(follower__isnull=False).first()
+        author = User.objects.filter(posts__isnull=False).first()
+        group = Group.objects.filter(posts__isnull=False).first()
+        post = Post.objects.filter(comments__isnull=False).first()
+        yield 'index: первая страница', seek_queryset(
+            posts, keys, None
+        )[:per_page]
+        if middle:
+            yield 'index: страница в середине ленты', seek_queryset(
+                posts, keys, middle[0]
+            )[:per_page]
+        if group is not None:
+            yield 'group_posts', seek_queryset(
+                group.posts.for_feed(), keys, None
+            )[:per_page]
+        if author is not None:
+            yield 'profile', seek_queryset(
+                author.posts.for_feed(), keys, None
+            )[:per_page]
+        if user is not None:
+            yield from self.follow_queries(user, author, per_page)
+        if post is not None:
+            # Как get_comments_page: первая страница комментариев с авторами
+            yield 'post_detail: комментарии', seek_queryset(
+                Comment.objects.filter(post_id=post.pk).select_related(
+                    'author'
+                ),
+                ('created', 'id'), None
+            )[:settings.COMMENTS_PAGINATION_COUNT + 1]
+
+    def follow_queries(self, user, author, per_page):
+        """ Запросы ленты подписок (TimelinePaginator): ключи из Inbox
+            и постов «тяжелых» авторов, затем сами посты по id.
+            Номерные страницы листают join по Follow."""
+        keys = ('pub_date', 'id')
+        yield 'follow_index: join по Follow (?page=N)', seek_queryset(
+            Post.objects.for_feed().filter(author__following__user=user),
+            keys, None
+        )[:per_page]
+        inbox = seek_queryset(
+            Inbox.objects.filter(user=user),
+            ('pub_date', 'post_id'), None
+        ).values_list('pub_date', 'post_id')[:per_page]
+        yield 'follow_index: лента Inbox', inbox
+        authors = sorted(pulled_authors() & followed_authors(user.pk))
+        if authors:
+            yield 'follow_index: посты «тяжелых» авторов', seek_queryset(
+                Post.objects.filter(author_id__in=authors), keys, None
+            ).values_list('pub_date', 'id')[:per_page]
+        ids = [pk for _, pk in inbox]
+        if ids:
+            yield 'follow_index: посты по id', Post.objects.for_feed().filter(
+                pk__in=ids
+            )
+        if author is not None:
+            yield 'profile: проверка подписки', Follow.objects.filter(
+                user=user, author=author
+            )[:1]
+
+    def report(self, title, queryset, repeat):
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        self.stdout.write(queryset.explain())
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            list(queryset.all())
+            elapsed = (time.perf_counter() - started) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        self.stdout.write(f'лучшее время: {best:.2f} мс\n')
@@ -0,0 +1,96 @@
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.template import engines
+from django.template.loader import get_template, render_to_string
+from django.test import RequestFactory, override_settings
+from django.utils import timezone
+
+from core.warmup import warm_templates
+from posts.cards import CARD_TEMPLATE
+from posts.models import Group, Post, User
+
+DUMMY_CACHE = {
+    'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Печатает время рендера шаблонов страниц с постами для разного '
+        'числа постов на странице. Посты создаются в памяти, БД и кэш '
+        'не используются: карточки каждый раз рендерятся заново.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--posts', type=int, nargs='+', default=[10, 100, 1000],
+            help='Число постов на странице'
+        )
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        # Сбрасываем cached.Loader (он включен без DEBUG), чтобы
+        # замерить полную компиляцию
+        for loader in engines['django'].engine.template_loaders:
+            if hasattr(loader, 'reset'):
+                loader.reset()
+        started = time.perf_counter()
+        names = warm_templates()
+        elapsed = (time.perf_counter() - started) * 1000
+        self.stdout.write(
+            f'Компиляция {len(names)} шаблонов: {elapsed:.1f} мс'
+        )
+        request = RequestFactory().get('/')
+        # Для гостя «дырки» страниц не обращаются к БД
+        request.user = AnonymousUser()
+        with override_settings(CACHES=DUMMY_CACHE):
+            for count in options['posts']:
+                self.stdout.write(
+                    self.style.MIGRATE_HEADING(f'Постов: {count}')
+                )
+                for name, context in self.contexts(count):
+                    best = self.measure(
+                        name, context, request, options['repeat']
+                    )
+                    self.stdout.write(
+                        f'{name:<40} {best:9.2f} мс '
+                        f'{best / count * 1000:9.1f} мкс/пост'
+                    )
+
+    def contexts(self, count):
+        """ Шаблоны и контекст, как их передают представления."""
+        author = User(pk=1, username='bench_author', first_name='Лев')
+        group = Group(pk=1, title='Группа', slug='bench', description='')
+        now = timezone.now()
+        posts = [
+            Post(
+                pk=i, text=f'Пост для замеров № {i}', author=author,
+                group=group if i % 2 else None, pub_date=now
+            ) for i in range(1, count + 1)
+        ]
+        page_obj = Paginator(posts, count).page(1)
+        yield CARD_TEMPLATE, {'posts': posts}
+        yield 'posts/index.html', {'page_obj': page_obj}
+        yield 'posts/follow.html', {'page_obj': page_obj}
+        yield 'posts/group_list.html', {'group': group, 'page_obj': page_obj}
+        yield 'posts/profile.html', {
+            'author': author, 'posts_count': count, 'page_obj': page_obj,
+        }
+
+    def measure(self, name, context, request, repeat):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            if name == CARD_TEMPLATE:
+                # Карточки по одной, как их рендерит posts.cards
+                template = get_template(name)
+                for post in context['posts']:
+                    template.render({'post': post})
+            else:
+                render_to_string(name, context, request=request)
+            elapsed = (time.perf_counter() - started) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        return best
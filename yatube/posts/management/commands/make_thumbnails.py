@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.thumbnails import GEOMETRIES, make_thumbnails, ready_thumbnail
+
+
+class Command(BaseCommand):
+    help = (
+        'Строит недостающие миниатюры картинок постов: для постов, '
+        'загруженных до фонового построения миниатюр, или после '
+        'добавления нового размера в posts.thumbnails.GEOMETRIES.'
+    )
+
+    def handle(self, *args, **options):
+        images = Post.objects.exclude(image='').values_list(
+            'image', flat=True
+        ).distinct().iterator()
+        built = failed = 0
+        for image in images:
+            if all(ready_thumbnail(image, name) for name in GEOMETRIES):
+                continue
+            try:
+                make_thumbnails(image)
+            except Exception as error:
+                failed += 1
+                self.stderr.write(f'{image}: {error!r}')
+                continue
+            built += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Построены миниатюры картинок: {built}, с ошибкой: {failed}'
+        ))
@@ -0,0 +1,195 @@
+import hashlib
+import math
+import posixpath
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as sorl_settings
+
+from posts.counters import forget_images, unreferenced_images
+from posts.models import Post
+from posts.thumbnails import (GEOMETRIES, forget_image, forget_thumbnail,
+                              thumbnail_names)
+
+
+def partition(name, partitions):
+    """ Номер прохода, в котором проверяется файл с этим именем."""
+    return int(hashlib.md5(name.encode()).hexdigest()[:8], 16) % partitions
+
+
+def walk(storage, directory):
+    """ Имена всех файлов каталога хранилища. В памяти только
+        содержимое одного каталога: картинки лежат по подкаталогам
+        хэша (core.storage), миниатюры sorl - в cache/xx/yy/."""
+    if not storage.exists(directory):
+        return
+    directories, files = storage.listdir(directory)
+    for name in files:
+        yield posixpath.join(directory, name)
+    for name in directories:
+        yield from walk(storage, posixpath.join(directory, name))
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет файлы картинок, на которые не ссылается ни один пост, '
+        'и миниатюры sorl, не относящиеся ни к одной картинке поста. '
+        'Ни дерево файлов, ни столбец Post.image не загружаются в память '
+        'целиком: имена делятся по хэшу на части, и каждая часть '
+        'проверяется своим проходом по БД и по файлам. С --quick '
+        'проверяются только картинки с нулевым счетчиком ссылок.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только посчитать, что будет удалено '
+                 '(с -v 2 - вывести имена файлов)'
+        )
+        parser.add_argument(
+            '--partitions', type=int,
+            help='Число проходов (по умолчанию - по '
+                 'MEDIA_GC_PARTITION_SIZE имен в памяти за проход)'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Файлов в одной пачке удаления'
+        )
+        parser.add_argument(
+            '--min-age', type=int, default=settings.MEDIA_GC_MIN_AGE,
+            help='Не трогать файлы моложе стольких секунд'
+        )
+        parser.add_argument(
+            '--quick', action='store_true',
+            help='Удалить только картинки, на которые по счетчикам '
+                 'ссылок (posts.counters) не ссылается ни один пост, '
+                 'и их миниатюры - без обхода файлов'
+        )
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        self.verbosity = options['verbosity']
+        self.batch_size = options['batch_size']
+        self.modified_before = time.time() - options['min_age']
+        self.image_storage = Post._meta.get_field('image').storage
+        self.image_dir = Post._meta.get_field('image').upload_to.rstrip('/')
+        self.found = {'images': 0, 'thumbnails': 0, 'bytes': 0}
+        if options['quick']:
+            self.collect_unreferenced()
+        else:
+            partitions = options['partitions'] or self.default_partitions()
+            for number in range(partitions):
+                self.stdout.write(f'Проход {number + 1} из {partitions}')
+                self.collect(number, partitions)
+        verb = 'Будет удалено' if self.dry_run else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} картинок: {self.found["images"]}, '
+            f'миниатюр: {self.found["thumbnails"]} '
+            f'({self.found["bytes"] / 2 ** 20:.1f} МБ)'
+        ))
+
+    def default_partitions(self):
+        # На каждую картинку приходится имя ее файла и имена миниатюр
+        names = Post.objects.exclude(image='').count() * (1 + len(GEOMETRIES))
+        return max(1, math.ceil(names / settings.MEDIA_GC_PARTITION_SIZE))
+
+    def referenced(self, number, partitions):
+        """ Имена файлов картинок и миниатюр этого прохода,
+            на которые ссылаются посты."""
+        images, thumbnails = set(), set()
+        column = Post.objects.exclude(image='').values_list(
+            'image', flat=True
+        ).iterator()
+        for image in column:
+            if partition(image, partitions) == number:
+                images.add(image)
+            thumbnails.update(
+                name for name in thumbnail_names(image)
+                if partition(name, partitions) == number
+            )
+        return images, thumbnails
+
+    def collect(self, number, partitions):
+        images, thumbnails = self.referenced(number, partitions)
+        trees = (
+            ('images', self.image_storage, self.image_dir, images),
+            ('thumbnails', default.storage,
+             sorl_settings.THUMBNAIL_PREFIX.rstrip('/'), thumbnails),
+        )
+        for kind, storage, directory, alive in trees:
+            batch = []
+            for name in walk(storage, directory):
+                if (partition(name, partitions) != number
+                        or name in alive or not self.is_old(storage, name)):
+                    continue
+                batch.append(name)
+                if len(batch) >= self.batch_size:
+                    self.delete(kind, storage, batch)
+                    batch = []
+            if batch:
+                self.delete(kind, storage, batch)
+
+    def collect_unreferenced(self):
+        """ Быстрый режим: картинки с нулевым счетчиком ссылок."""
+        after = ''
+        while True:
+            batch = unreferenced_images(after, self.batch_size)
+            if not batch:
+                return
+            after = batch[-1]
+            existing = [
+                name for name in batch if self.image_storage.exists(name)
+            ]
+            deleted = self.delete('images', self.image_storage, existing)
+            for name in deleted:
+                for thumbnail in thumbnail_names(name):
+                    if default.storage.exists(thumbnail):
+                        self.remove('thumbnails', default.storage, thumbnail)
+            if not self.dry_run:
+                # Счетчики файлов, которых уже нет, тоже не нужны
+                forget_images(set(batch) - set(existing))
+
+    def is_old(self, storage, name):
+        try:
+            modified = storage.get_modified_time(name).timestamp()
+        except OSError:
+            # Файл уже удален
+            return False
+        return modified < self.modified_before
+
+    def delete(self, kind, storage, batch):
+        """ Удаляет пачку файлов, возвращает имена удаленных."""
+        if kind == 'images':
+            # Пост мог сослаться на файл уже после прохода по БД
+            alive = set(Post.objects.filter(
+                image__in=batch
+            ).values_list('image', flat=True))
+            batch = [name for name in batch if name not in alive]
+        deleted = [
+            name for name in batch if self.remove(kind, storage, name)
+        ]
+        if kind == 'images' and not self.dry_run:
+            forget_images(deleted)
+        return deleted
+
+    def remove(self, kind, storage, name):
+        # Одинаковую картинку могли загрузить снова уже после
+        # проверки: core.storage обновляет время изменения файла
+        if not self.is_old(storage, name):
+            return False
+        self.found[kind] += 1
+        self.found['bytes'] += storage.size(name)
+        if self.verbosity > 1:
+            self.stdout.write(f'  {name}')
+        if self.dry_run:
+            return True
+        if kind == 'images':
+            # Файлы миниатюр удаляет проход по миниатюрам (или быстрый
+            # режим): так пробный запуск насчитает столько же файлов
+            forget_image(name, delete_thumbnails=False)
+        else:
+            forget_thumbnail(name)
+        storage.delete(name)
+        return True
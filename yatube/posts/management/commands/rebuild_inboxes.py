@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.models import Follow, Inbox, User
+from posts.timeline import rebuild_inbox
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает ленты подписок (posts.Inbox) по таблице Follow.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'usernames',
+            nargs='*',
+            help='Пользователи, чьи ленты нужно пересобрать (по умолчанию все)'
+        )
+
+    def handle(self, *args, **options):
+        if options['usernames']:
+            user_ids = User.objects.filter(
+                username__in=options['usernames']
+            ).values_list('pk', flat=True)
+        else:
+            # Ленты тех, кто ни на кого не подписан, должны быть пустыми
+            Inbox.objects.exclude(
+                user__in=Follow.objects.values('user')
+            ).delete()
+            user_ids = Follow.objects.values_list(
+                'user_id', flat=True
+            ).distinct()
+        rebuilt = 0
+        for user_id in user_ids.iterator():
+            with transaction.atomic():
+                rebuild_inbox(user_id)
+            rebuilt += 1
+        self.stdout.write(self.style.SUCCESS(f'Пересобрано лент: {rebuilt}'))
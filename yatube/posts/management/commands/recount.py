@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from posts.counters import TOTAL_POSTS, counter_name, image_counter_name
+from posts.models import Counter, Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает счетчики постов (posts.Counter) по таблице постов, '
+        'в том числе счетчики ссылок на файлы картинок.'
+    )
+
+    def handle(self, *args, **options):
+        actual = {TOTAL_POSTS: Post.objects.count()}
+        by_author = Post.objects.values_list('author').annotate(
+            posts=Count('pk')
+        ).order_by()
+        for author_id, posts in by_author:
+            actual[counter_name(author_id=author_id)] = posts
+        by_group = Post.objects.filter(group__isnull=False).values_list(
+            'group'
+        ).annotate(posts=Count('pk')).order_by()
+        for group_id, posts in by_group:
+            actual[counter_name(group_id=group_id)] = posts
+        by_image = Post.objects.exclude(image='').values_list(
+            'image'
+        ).annotate(posts=Count('pk')).order_by()
+        for image, posts in by_image:
+            name = image_counter_name(image)
+            if name is not None:
+                actual[name] = posts
+        fixed = 0
+        with transaction.atomic():
+            counters = Counter.objects.select_for_update().filter(
+                name__startswith='posts:'
+            )
+            for counter in counters:
+                value = actual.pop(counter.name, 0)
+                if counter.value != value:
+                    counter.value = value
+                    counter.save(update_fields=['value'])
+                    fixed += 1
+            Counter.objects.bulk_create(
+                Counter(name=name, value=value)
+                for name, value in actual.items()
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено счетчиков: {fixed}, создано: {len(actual)}'
+        ))
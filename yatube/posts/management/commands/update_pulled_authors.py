@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from posts.timeline import update_pulled_authors
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает «тяжелых» авторов ленты подписок (posts.PulledAuthor) '
+        'по таблице Follow и раскладывает по лентам посты авторов, '
+        'вышедших из множества. Запускается периодически (например, '
+        'из cron раз в несколько минут).'
+    )
+
+    def handle(self, *args, **options):
+        authors = update_pulled_authors()
+        self.stdout.write(self.style.SUCCESS(
+            f'«Тяжелых» авторов: {len(authors)}'
+        ))
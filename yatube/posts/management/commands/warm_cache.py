@@ -0,0 +1,138 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+
+from posts.counters import largest
+from posts.models import Group, Post, User
+from posts.paginators import encode_cursor
+
+
+class Command(BaseCommand):
+    help = (
+        'Заранее строит и кладет в кэш популярные страницы: первые '
+        'страницы главной, самых больших групп и профилей и свежие посты. '
+        'Страницы общие для всех пользователей (см. core.holes), поэтому '
+        'достаточно построить их для гостя.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--pages', type=int, default=3,
+            help='Сколько первых страниц каждой ленты строить'
+        )
+        parser.add_argument('--groups', type=int, default=10)
+        parser.add_argument('--profiles', type=int, default=10)
+        parser.add_argument('--posts', type=int, default=50)
+        parser.add_argument(
+            '--concurrency', type=int, default=4,
+            help='Число параллельных потоков'
+        )
+        parser.add_argument(
+            '--budget', type=float, default=60,
+            help='Ограничение по времени (секунды): оставшиеся страницы '
+                 'пропускаются'
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        urls = list(self.urls(options))
+        deadline = started + options['budget']
+        warmed = skipped = failed = 0
+        for url, status in self.run(urls, deadline, options['concurrency']):
+            if isinstance(status, Exception):
+                failed += 1
+                self.stderr.write(f'{url}: {status!r}')
+            elif status is None:
+                skipped += 1
+            elif status == 200:
+                warmed += 1
+            else:
+                failed += 1
+                self.stderr.write(f'{url}: {status}')
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Страниц в кэше: {warmed}, пропущено по времени: {skipped}, '
+            f'с ошибкой: {failed}, за {elapsed:.1f} с'
+        ))
+
+    def run(self, urls, deadline, concurrency):
+        """ Пары (адрес, код ответа, None или исключение)."""
+        if concurrency <= 1:
+            for url in urls:
+                yield url, self.attempt(self.warm, url, deadline)
+            return
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = {
+                pool.submit(self.attempt, self.warm_in_thread, url, deadline):
+                url for url in urls
+            }
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+
+    def attempt(self, warm, url, deadline):
+        try:
+            return warm(url, deadline)
+        except Exception as error:
+            return error
+
+    def urls(self, options):
+        pages = options['pages']
+        yield from self.feed_urls(
+            reverse('posts:index'), Post.objects.all(), pages
+        )
+        groups = Group.objects.filter(
+            pk__in=largest('group', options['groups'])
+        )
+        for group in groups:
+            yield from self.feed_urls(
+                reverse('posts:group_list', kwargs={'slug': group.slug}),
+                group.posts.all(), pages
+            )
+        authors = User.objects.filter(
+            pk__in=largest('author', options['profiles'])
+        )
+        for author in authors:
+            yield from self.feed_urls(
+                reverse('posts:profile', kwargs={'username': author.username}),
+                author.posts.all(), pages
+            )
+        recent = Post.objects.order_by(
+            '-pub_date', '-id'
+        ).values_list('pk', flat=True)[:options['posts']]
+        for post_id in recent:
+            yield reverse('posts:post_detail', kwargs={'post_id': post_id})
+
+    def feed_urls(self, url, posts, pages):
+        """ Адреса первых страниц ленты - с теми же курсорами,
+            что стоят в ссылках «Следующая»."""
+        yield url
+        per_page = settings.PAGINATION_COUNT
+        keys = posts.order_by('-pub_date', '-id').values_list(
+            'pub_date', 'id'
+        )[:per_page * (pages - 1)]
+        for pub_date, pk in list(keys)[per_page - 1::per_page]:
+            yield f'{url}?after={encode_cursor(pub_date, pk)}'
+
+    def warm(self, url, deadline):
+        """ Строит страницу тем же представлением, что и для гостя.
+            Возвращает код ответа или None, если время вышло."""
+        if time.monotonic() >= deadline:
+            return None
+        request = RequestFactory().get(url)
+        request.user = AnonymousUser()
+        request.resolver_match = resolve(request.path_info)
+        view, args, kwargs = request.resolver_match
+        return view(request, *args, **kwargs).status_code
+
+    def warm_in_thread(self, url, deadline):
+        try:
+            return self.warm(url, deadline)
+        finally:
+            # У каждого потока свое соединение с БД
+            connection.close()
@@ -0,0 +1,21 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_inbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Counter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True, verbose_name='Имя счетчика')),
+                ('value', models.PositiveIntegerField(default=0, verbose_name='Значение')),
+            ],
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:51
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Прежние отметки «тяжелых» авторов в таблице счетчиков
+PULLED_MARK = 'feed:pulled:'
+
+
+def move_pulled_marks(apps, schema_editor):
+    """ Переносит отметки «тяжелых» авторов из таблицы счетчиков."""
+    Counter = apps.get_model('posts', 'Counter')
+    PulledAuthor = apps.get_model('posts', 'PulledAuthor')
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    marks = Counter.objects.filter(name__startswith=PULLED_MARK)
+    followers = {
+        int(name[len(PULLED_MARK):]): value
+        for name, value in marks.values_list('name', 'value')
+    }
+    # Отметки удаленных пользователей не переносятся
+    authors = User.objects.filter(
+        pk__in=followers
+    ).values_list('pk', flat=True)
+    PulledAuthor.objects.bulk_create([
+        PulledAuthor(author_id=pk, followers=followers[pk]) for pk in authors
+    ])
+    marks.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('posts', '0014_post_image_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PulledAuthor',
+            fields=[
+                ('author', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='pulled', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('followers', models.PositiveIntegerField(default=0, verbose_name='Подписчиков')),
+            ],
+        ),
+        migrations.RunPython(move_pulled_marks, migrations.RunPython.noop),
+    ]
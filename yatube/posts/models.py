@@ -1,6 +1,8 @@
 from django.contrib.auth import get_user_model
 from django.db import models
 
+from core.storage import content_addressed_storage
+
 User = get_user_model()
 
 
@@ -18,6 +20,24 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    # Поля, которые выводит карточка поста (posts/includes/current_post.html)
+    FEED_FIELDS = (
+        'id', 'text', 'pub_date', 'image',
+        'author', 'author__username',
+        'author__first_name', 'author__last_name',
+        'group', 'group__title', 'group__slug',
+    )
+
+    def for_feed(self):
+        """ Посты для лент: автор и группа приходят в том же запросе,
+            из таблиц берутся только поля, которые показывает карточка.
+        """
+        return self.select_related('author', 'group').only(
+            *self.FEED_FIELDS
+        )
+
+
 class Post(models.Model):
     """ Класс описывает таблицу для хранения постов."""
     # Текст поста
@@ -31,10 +51,12 @@ class Post(models.Model):
         auto_now_add=True
     )
     # поле "автор" - для связи с таблицей User
+    # (отдельный индекс не нужен: author - префикс составного индекса)
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
         related_name='posts',
+        db_index=False,
         verbose_name='автор'
     )
     # Поле для связи с таблицей Group
@@ -44,6 +66,7 @@ class Post(models.Model):
         on_delete=models.SET_NULL,
         blank=True,
         null=True,
+        db_index=False,
         verbose_name='Группа',
         help_text='Группа, к которой будет относиться пост'
     )
@@ -51,13 +74,37 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=content_addressed_storage,
         blank=True
     )
     # Аргумент upload_to указывает директорию,
     # в которую будут загружаться пользовательские файлы.
+    # Имя файла - хэш содержимого: одинаковые картинки хранятся
+    # один раз (core.storage)
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         ordering = ['-pub_date']
+        indexes = [
+            # индекс для выборки ленты по курсору (pub_date, id)
+            models.Index(
+                fields=['pub_date', 'id'],
+                name='post_pub_date_id_idx'
+            ),
+            # лента автора (profile) и лента группы (group_posts)
+            models.Index(
+                fields=['author', 'pub_date', 'id'],
+                name='post_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=['group', 'pub_date', 'id'],
+                name='post_group_pub_date_idx'
+            ),
+            # посты с данным файлом картинки: счетчик ссылок на файл
+            # (posts.counters) и сборщик мусора media_gc
+            models.Index(fields=['image'], name='post_image_idx'),
+        ]
 
     def __str__(self) -> str:
         # метод для вывода текста при печати объекта
@@ -70,6 +117,7 @@ class Comment(models.Model):
         Post,
         on_delete=models.CASCADE,
         related_name='comments',
+        db_index=False,
         verbose_name='комментарий'
     )
     author = models.ForeignKey(
@@ -90,6 +138,13 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ['-created']
+        indexes = [
+            # комментарии поста на странице post_detail
+            models.Index(
+                fields=['post', 'created', 'id'],
+                name='comment_post_created_idx'
+            ),
+        ]
 
 
 class Follow(models.Model):
@@ -101,6 +156,7 @@ class Follow(models.Model):
         User,
         on_delete=models.CASCADE,
         related_name='following',
+        db_index=False,
         verbose_name='Подписка'
     )
     # Подписчик
@@ -108,5 +164,96 @@ class Follow(models.Model):
         User,
         on_delete=models.CASCADE,
         related_name='follower',
+        db_index=False,
+        verbose_name='Подписчик'
+    )
+
+    class Meta:
+        constraints = [
+            # индекс (user, author) обслуживает и проверку подписки,
+            # и выборку авторов, на которых подписан пользователь
+            models.UniqueConstraint(
+                fields=['user', 'author'],
+                name='unique_follow'
+            ),
+        ]
+        indexes = [
+            # подписчики автора (раскладка постов по лентам)
+            models.Index(
+                fields=['author', 'user'],
+                name='follow_author_user_idx'
+            ),
+        ]
+
+
+class Inbox(models.Model):
+    """ Модель описывает материализованную ленту подписок:
+        по записи на каждую пару (подписчик, пост автора из подписок).
+        Заполняется при публикации поста и при подписке,
+        читается одним проходом по индексу (user, pub_date, post).
+    """
+    # Читатель ленты
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='inbox',
+        db_index=False,
         verbose_name='Подписчик'
     )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='inbox_entries',
+        verbose_name='Пост'
+    )
+    # Копия даты публикации поста, чтобы сортировать без join
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        ordering = ['-pub_date', '-post']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_inbox_entry'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', 'pub_date', 'post'],
+                name='inbox_user_pub_date_idx'
+            ),
+        ]
+
+
+class PulledAuthor(models.Model):
+    """ Модель описывает «тяжелых» авторов ленты подписок: их посты
+        не раскладываются по Inbox, а подмешиваются в ленту при чтении.
+        Таблицу пересчитывает команда update_pulled_authors
+        (см. posts.timeline).
+    """
+    author = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='pulled',
+        verbose_name='Автор'
+    )
+    # Число подписчиков при последнем пересчете
+    followers = models.PositiveIntegerField('Подписчиков', default=0)
+
+    def __str__(self) -> str:
+        return f'{self.author_id}: {self.followers}'
+
+
+class Counter(models.Model):
+    """ Модель описывает таблицу хранимых счетчиков
+        (число постов всего, у автора, в группе, ссылок на файл
+        картинки).
+        Счетчики поддерживаются сигналами моделей, чтобы страницы
+        не выполняли COUNT(*) при каждом показе.
+    """
+    name = models.CharField('Имя счетчика', max_length=64, unique=True)
+    value = models.PositiveIntegerField('Значение', default=0)
+
+    def __str__(self) -> str:
+        return f'{self.name}={self.value}'
@@ -0,0 +1,203 @@
+import hashlib
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
+from core import holes, single_flight
+from users.cache import get_user_by_username
+
+from .models import Group, Post
+
+GENERATION_KEY = 'page_gen:{}'
+POST_AUTHOR_KEY = 'post_author:{}'
+# Область, общая для всех страниц: ее сбрасывают редкие события,
+# меняющие сразу много страниц (переименование группы или автора)
+SITE_SCOPE = 'site'
+
+
+def index_scopes():
+    return [SITE_SCOPE, 'index']
+
+
+def group_scopes(slug):
+    return [SITE_SCOPE, f'group:{slug}']
+
+
+def profile_scope(author_id):
+    # Область профиля - по id автора: его знают и страница поста,
+    # и сигналы, не обращаясь к таблице пользователей
+    return f'profile:{author_id}'
+
+
+def profile_scopes(username):
+    # Автор читается из кэша (users.cache)
+    author = get_user_by_username(username)
+    return [SITE_SCOPE, profile_scope(author.pk if author else None)]
+
+
+def post_author_id(post_id):
+    """ id автора поста (из кэша) или None.
+        Автор поста не меняется, поэтому запись живет бессрочно."""
+    key = POST_AUTHOR_KEY.format(post_id)
+    author_id = cache.get(key)
+    if author_id is None:
+        author_id = Post.objects.filter(
+            pk=post_id
+        ).values_list('author_id', flat=True).first()
+        if author_id is not None:
+            cache.set(key, author_id, None)
+    return author_id
+
+
+def post_scopes(post_id):
+    # На странице поста выводится число постов автора,
+    # поэтому она зависит и от области профиля
+    return [
+        SITE_SCOPE, f'post:{post_id}', profile_scope(post_author_id(post_id))
+    ]
+
+
+def generation_key(scope):
+    # Имя пользователя может содержать не-ASCII символы,
+    # недопустимые в ключах memcached
+    return GENERATION_KEY.format(hashlib.md5(scope.encode()).hexdigest())
+
+
+def _new_generation():
+    return uuid.uuid4().hex[:12]
+
+
+def get_generations(scopes):
+    """ Текущие поколения областей кэша (одним get_many).
+        Для потерянного (вытесненного) поколения заводится новое
+        случайное значение, поэтому старые страницы не вернутся.
+    """
+    keys = [generation_key(scope) for scope in scopes]
+    generations = cache.get_many(keys)
+    missing = {
+        key: _new_generation() for key in keys if key not in generations
+    }
+    if missing:
+        cache.set_many(missing, None)
+        generations.update(missing)
+    return [generations[key] for key in keys]
+
+
+def bump(*scopes):
+    """ Сбрасывает все закэшированные страницы областей."""
+    cache.set_many(
+        {generation_key(scope): _new_generation() for scope in scopes},
+        None
+    )
+
+
+def bump_post(post, group_ids=()):
+    """ Сбрасывает страницы, на которых выводится пост."""
+    scopes = ['index', f'post:{post.pk}', profile_scope(post.author_id)]
+    group_ids = [pk for pk in group_ids if pk is not None]
+    if group_ids:
+        slugs = Group.objects.filter(
+            pk__in=group_ids
+        ).values_list('slug', flat=True)
+        scopes.extend(f'group:{slug}' for slug in slugs)
+    bump(*scopes)
+
+
+def page_key(name, request, generations):
+    """ Ключ общей для всех пользователей страницы: имя представления
+        (по нему счетчики кэша делятся на семейства), адрес
+        с параметрами и поколения."""
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f'page:{name}:{path}:{".".join(generations)}'
+
+
+def page_etag(key, request):
+    # Готовая страница (с «дырками») у каждого пользователя своя
+    user = request.user.pk if request.user.is_authenticated else 'anon'
+    return quote_etag(hashlib.md5(f'{key}:{user}'.encode()).hexdigest())
+
+
+def _is_cacheable(response):
+    return response.status_code == 200 and not response.streaming
+
+
+def fill_response(request, response):
+    """ Копия закэшированной страницы с «дырками» текущего запроса."""
+    filled = HttpResponse(
+        holes.fill(request, response.content.decode(response.charset)),
+        content_type=response['Content-Type'],
+    )
+    filled['ETag'] = page_etag(response.page_key, request)
+    return filled
+
+
+def fill_uncached(request, response):
+    """ Заполняет метки в некэшируемом ответе (не 200) на месте."""
+    is_html = response.get('Content-Type', '').startswith('text/html')
+    if not response.streaming and is_html:
+        response.content = holes.fill(
+            request, response.content.decode(response.charset)
+        )
+    return response
+
+
+def cache_page_versioned(scopes, timeout=None):
+    """ Декоратор кэширования страницы.
+        В ключ страницы входят поколения областей scopes(**kwargs),
+        поэтому после записи в БД (см. posts.signals) страница
+        сразу строится заново, а без записей живет timeout секунд.
+        Страницу строит один запрос, остальные в это время получают
+        предыдущую версию (см. core.single_flight).
+        В кэше хранится одна страница на всех: куски, зависящие от
+        пользователя (шапка, кнопка подписки, форма комментария),
+        остаются в ней метками и рендерятся в каждом запросе
+        (см. core.holes).
+        Для условного GET страница получает ETag (по ключу страницы
+        и пользователю): если он совпадает с If-None-Match, ответ 304
+        отдается без рендера и без обращения к кэшу страниц.
+        Last-Modified не отправляется: у него точность в секунду,
+        и две записи за одну секунду дали бы 304 для измененной
+        страницы, а содержимое страницы у каждого пользователя свое.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            generations = get_generations(scopes(**kwargs))
+            key = page_key(view.__name__, request, generations)
+            etag = page_etag(key, request)
+            not_modified = get_conditional_response(request, etag=etag)
+            if not_modified is not None:
+                not_modified['ETag'] = etag
+                return not_modified
+
+            def build():
+                holes.punch(request)
+                try:
+                    response = view(request, *args, **kwargs)
+                finally:
+                    # Страница ошибки (Http404 из представления)
+                    # рендерится уже без меток
+                    holes.mend(request)
+                # Ключ хранится вместе со страницей: предыдущая
+                # версия (latest_key) отдается со своим ETag
+                if _is_cacheable(response):
+                    response.page_key = key
+                return response
+
+            response = single_flight.get_or_build(
+                key, build, timeout or settings.PAGE_CACHE_TIMEOUT,
+                latest_key=page_key(view.__name__, request, ['latest']),
+                cacheable=_is_cacheable,
+            )
+            if not _is_cacheable(response):
+                return fill_uncached(request, response)
+            return fill_response(request, response)
+        return wrapper
+    return decorator
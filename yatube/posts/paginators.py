@@ -0,0 +1,130 @@
+import base64
+import binascii
+
+from django.core.paginator import Paginator
+from django.db.models import Q, QuerySet
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+
+def encode_cursor(value, pk):
+    """ Упаковывает ключ (дата, id) в непрозрачный токен для адресной строки.
+    """
+    raw = f'{value.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """ Распаковывает токен курсора.
+        Для пустого или испорченного токена возвращает None,
+        тогда показывается первая страница (как у Paginator.get_page).
+    """
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        value, pk = raw.decode().split('|')
+        value = parse_datetime(value)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if value is None:
+        return None
+    return value, pk
+
+
+def seek_queryset(queryset, keys, cursor, forward=True):
+    """ Отбирает элементы строго за курсором и сортирует их по ключу keys.
+        forward=True - более старые элементы (по убыванию ключа),
+        forward=False - более новые (по возрастанию ключа).
+    """
+    date_field, id_field = keys
+    lookup, bound = ('lt', 'lte') if forward else ('gt', 'gte')
+    if cursor is not None:
+        value, pk = cursor
+        # Первое условие избыточно, но дает базе границу диапазона
+        # по индексу: условие с OR она в диапазон не превращает
+        queryset = queryset.filter(
+            Q(**{f'{date_field}__{bound}': value}),
+            Q(**{f'{date_field}__{lookup}': value})
+            | Q(**{date_field: value, f'{id_field}__{lookup}': pk})
+        )
+    prefix = '-' if forward else ''
+    return queryset.order_by(f'{prefix}{date_field}', f'{prefix}{id_field}')
+
+
+class KeysetPaginator(Paginator):
+    """ Паджинатор «по ключу» (pub_date, id).
+        Страница выбирается условием «строго раньше/позже курсора»,
+        которое обслуживается индексом, поэтому нет ни OFFSET, ни COUNT.
+        Номерные страницы (get_page) работают как у обычного Paginator.
+        Вместо COUNT(*) можно передать функцию count, возвращающую
+        хранимое число элементов.
+    """
+    def __init__(self, object_list, per_page, keys=('pub_date', 'id'),
+                 count=None, **kwargs):
+        self.keys = keys
+        self.count_func = count
+        if isinstance(object_list, QuerySet):
+            # id добавлен в сортировку, чтобы порядок был однозначным
+            # и совпадал в номерном и курсорном режимах
+            object_list = object_list.order_by(
+                *(f'-{key}' for key in keys)
+            )
+        super().__init__(object_list, per_page, **kwargs)
+
+    @cached_property
+    def count(self):
+        if self.count_func is not None:
+            return self.count_func()
+        return super().count
+
+    def cursor_for(self, item):
+        """ Токен курсора, указывающий на данный элемент."""
+        date_field, id_field = self.keys
+        return encode_cursor(
+            getattr(item, date_field), getattr(item, id_field)
+        )
+
+    def seek(self, cursor, forward=True):
+        """ Возвращает до per_page + 1 элементов за курсором.
+            Лишний элемент показывает, есть ли что-то дальше.
+        """
+        queryset = seek_queryset(self.object_list, self.keys, cursor, forward)
+        return list(queryset[:self.per_page + 1])
+
+    def get_cursor_page(self, after=None, before=None):
+        """ Возвращает страницу после курсора after или перед курсором before.
+            Объект страницы - обычный Page с дополнительными атрибутами
+            keyset, next_cursor и previous_cursor.
+        """
+        after = decode_cursor(after)
+        before = decode_cursor(before)
+        if before is not None:
+            items = self.seek(before, forward=False)
+            if len(items) > self.per_page:
+                items.reverse()
+                return self._make_cursor_page(
+                    items[1:], has_previous=True, has_next=True
+                )
+            # Перед курсором меньше целой страницы - это начало ленты
+            after = None
+        items = self.seek(after)
+        has_next = len(items) > self.per_page
+        return self._make_cursor_page(
+            items[:self.per_page],
+            has_previous=after is not None,
+            has_next=has_next
+        )
+
+    def _make_cursor_page(self, items, has_previous, has_next):
+        # Номера у курсорной страницы нет
+        page = self._get_page(items, None, self)
+        page.keyset = True
+        page.next_cursor = None
+        page.previous_cursor = None
+        if items and has_next:
+            page.next_cursor = self.cursor_for(items[-1])
+        if items and has_previous:
+            page.previous_cursor = self.cursor_for(items[0])
+        return page
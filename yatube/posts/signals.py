@@ -0,0 +1,143 @@
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from . import cards, counters, follows, page_cache, thumbnails, timeline
+from .models import Comment, Counter, Follow, Group, Post, User
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, raw=False, **kwargs):
+    # Запоминаем прежнюю группу, чтобы поправить счетчики групп,
+    # и прежнюю картинку, чтобы не строить миниатюры заново
+    instance._old_group_id = None
+    instance._old_image = ''
+    if instance.pk is not None and not raw:
+        instance._old_group_id, instance._old_image = Post.objects.filter(
+            pk=instance.pk
+        ).values_list('group_id', 'image').first() or (None, '')
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    """ Новый пост сразу попадает в ленты подписчиков автора
+        и в счетчики постов, у измененного поста сбрасывается карточка."""
+    if raw:
+        return
+    if instance.image and instance.image.name != instance._old_image:
+        thumbnails.schedule(instance.image.name)
+    counters.image_changed(instance._old_image, instance.image.name)
+    page_cache.bump_post(
+        instance, [instance._old_group_id, instance.group_id]
+    )
+    if created:
+        timeline.fan_out_post(instance)
+        counters.post_changed(instance, 1, instance.group_id)
+        return
+    cards.invalidate_cards([instance.pk])
+    if instance._old_group_id != instance.group_id:
+        if instance._old_group_id is not None:
+            counters.change(
+                counters.counter_name(group_id=instance._old_group_id), -1
+            )
+        if instance.group_id is not None:
+            counters.change(
+                counters.counter_name(group_id=instance.group_id), 1
+            )
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.post_changed(instance, -1, instance.group_id)
+    # Файл картинки остается: его могут использовать другие посты,
+    # файлы без ссылок убирает media_gc
+    counters.image_changed(instance.image.name, None)
+    cards.invalidate_cards([instance.pk])
+    page_cache.bump_post(instance, [instance.group_id])
+    timeline.post_removed(instance)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def comment_changed(sender, instance, raw=False, **kwargs):
+    # Комментарии выводятся на странице поста
+    if not raw:
+        page_cache.bump(f'post:{instance.post_id}')
+
+
+@receiver(pre_save, sender=Group)
+def group_saving(sender, instance, raw=False, **kwargs):
+    # Название и slug группы выводятся в карточках ее постов
+    instance._renamed = False
+    if instance.pk is not None and not raw:
+        instance._renamed = not Group.objects.filter(
+            pk=instance.pk, title=instance.title, slug=instance.slug
+        ).exists()
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw and instance._renamed:
+        cards.invalidate_cards(
+            instance.posts.values_list('pk', flat=True).iterator()
+        )
+        page_cache.bump(page_cache.SITE_SCOPE)
+    elif not raw:
+        page_cache.bump(f'group:{instance.slug}')
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleting(sender, instance, **kwargs):
+    # Посты удаляемой группы остаются, но уже без ссылки на нее
+    cards.invalidate_cards(
+        instance.posts.values_list('pk', flat=True).iterator()
+    )
+    page_cache.bump(page_cache.SITE_SCOPE)
+
+
+@receiver(pre_save, sender=User)
+def user_saving(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Имя автора и ссылка на его профиль выводятся в карточках постов
+    instance._renamed = False
+    name_fields = {'username', 'first_name', 'last_name'}
+    if update_fields is not None and not name_fields & set(update_fields):
+        return
+    if instance.pk is not None and not raw:
+        instance._renamed = not User.objects.filter(
+            pk=instance.pk,
+            username=instance.username,
+            first_name=instance.first_name,
+            last_name=instance.last_name
+        ).exists()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw and getattr(instance, '_renamed', False):
+        cards.invalidate_cards(
+            instance.posts.values_list('pk', flat=True).iterator()
+        )
+        page_cache.bump(page_cache.SITE_SCOPE)
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    Counter.objects.filter(
+        name=counters.counter_name(group_id=instance.pk)
+    ).delete()
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        follows.forget(instance.user_id)
+        timeline.add_author(instance.user_id, instance.author_id)
+        # На странице автора меняется кнопка подписки
+        page_cache.bump(page_cache.profile_scope(instance.author_id))
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    follows.forget(instance.user_id)
+    timeline.remove_author(instance.user_id, instance.author_id)
+    page_cache.bump(page_cache.profile_scope(instance.author_id))
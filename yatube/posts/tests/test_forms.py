@@ -1,12 +1,20 @@
+import os
 import shutil
 import tempfile
+from io import BytesIO
+
+from PIL import Image
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.shortcuts import get_object_or_404
 from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
+from core.storage import file_digest
+from posts.counters import get_image_refs
 from posts.forms import PostForm
 from posts.models import Comment, Group, Post
 
@@ -110,6 +118,15 @@ class PostsCreateFormTests(TestCase):
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class PostsCreateFormContentsPictureTests(TestCase):
+    SMALL_GIF = (
+        b'\x47\x49\x46\x38\x39\x61\x02\x00'
+        b'\x01\x00\x80\x00\x00\x00\x00\x00'
+        b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+        b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+        b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+        b'\x0A\x00\x3B'
+    )
+
     @classmethod
     def setUpClass(cls):
         super().setUpClass()
@@ -134,17 +151,9 @@ class PostsCreateFormContentsPictureTests(TestCase):
         """Валидная форма создает запись в Post с картинкой."""
 
         posts_count = Post.objects.count()
-        small_gif = (
-            b'\x47\x49\x46\x38\x39\x61\x02\x00'
-            b'\x01\x00\x80\x00\x00\x00\x00\x00'
-            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
-            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
-            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
-            b'\x0A\x00\x3B'
-        )
         uploaded = SimpleUploadedFile(
             name='small.gif',
-            content=small_gif,
+            content=self.SMALL_GIF,
             content_type='image/gif'
         )
         form_data = {
@@ -169,7 +178,85 @@ class PostsCreateFormContentsPictureTests(TestCase):
         latest_post = Post.objects.latest('id')
         self.assertEqual(latest_post.text, form_data['text'])
         self.assertEqual(latest_post.group, self.group)
-        self.assertEqual(latest_post.image, 'posts/small.gif')
+        # Файл назван по содержимому
+        digest = file_digest(uploaded)
+        self.assertEqual(
+            latest_post.image, f'posts/{digest[:2]}/{digest}.gif'
+        )
+
+    def test_same_picture_stored_once(self):
+        """ Одинаковые картинки хранятся одним файлом,
+            число ссылок на него ведется в счетчиках."""
+        with CaptureQueriesContext(connection) as queries:
+            posts = [
+                Post.objects.create(
+                    author=self.user, text=f'Пост с картинкой {i}',
+                    image=SimpleUploadedFile(
+                        name=name, content=self.SMALL_GIF,
+                        content_type='image/gif'
+                    )
+                ) for i, name in enumerate(('small.gif', 'copy.gif'))
+            ]
+        # Посты с картинкой ищутся по индексу, а не по LIKE
+        self.assertFalse(
+            any('LIKE' in query['sql'] for query in queries.captured_queries)
+        )
+        first, second = posts
+        self.assertEqual(first.image.name, second.image.name)
+        directory = os.path.dirname(first.image.path)
+        self.assertEqual(os.listdir(directory), [
+            os.path.basename(first.image.name)
+        ])
+        self.assertEqual(get_image_refs(first.image.name), 2)
+        # Файл остается, пока на него ссылается другой пост
+        first.delete()
+        self.assertEqual(get_image_refs(second.image.name), 1)
+        self.assertTrue(os.path.exists(second.image.path))
+
+
+class PostFormImageNormalizationTest(TestCase):
+    """ Класс проверяет обработку загруженной картинки в PostForm."""
+    @staticmethod
+    def jpeg(size, orientation=None):
+        image = Image.new('RGB', size, color=(200, 0, 0))
+        options = {}
+        if orientation is not None:
+            exif = Image.Exif()
+            exif[0x0112] = orientation
+            options['exif'] = exif.tobytes()
+        buffer = BytesIO()
+        image.save(buffer, 'JPEG', **options)
+        return SimpleUploadedFile(
+            'photo.jpg', buffer.getvalue(), content_type='image/jpeg'
+        )
+
+    def clean_image(self, upload):
+        form = PostForm(data={'text': 'Текст'}, files={'image': upload})
+        return form, form.is_valid() and form.cleaned_data['image']
+
+    @override_settings(POST_IMAGE_MAX_SIDE=100)
+    def test_large_image_reduced_and_rotated(self):
+        """ Большая картинка уменьшается, поворачивается по EXIF
+            и теряет EXIF."""
+        _, image = self.clean_image(self.jpeg((300, 200), orientation=6))
+        with Image.open(image) as result:
+            self.assertEqual(result.size, (67, 100))
+            self.assertNotIn('exif', result.info)
+        self.assertEqual(image.name, 'photo.jpg')
+
+    def test_small_image_kept(self):
+        """ Картинка, которую менять не нужно, сохраняется как есть."""
+        upload = self.jpeg((30, 20))
+        _, image = self.clean_image(upload)
+        self.assertIs(image, upload)
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=100)
+    def test_too_many_pixels_rejected(self):
+        """ Картинка больше POST_IMAGE_MAX_PIXELS пикселей отклоняется."""
+        form, _ = self.clean_image(self.jpeg((20, 20)))
+        self.assertEqual(
+            form.errors.as_data()['image'][0].code, 'image_too_large'
+        )
 
 
 class PostFormsCommentsTest(TestCase):
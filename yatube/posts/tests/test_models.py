@@ -1,7 +1,12 @@
+from io import StringIO
+
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import IntegrityError
 from django.test import TestCase
 
-from posts.models import Group, Post
+from posts.counters import counter_name, get_posts_count
+from posts.models import Counter, Follow, Group, Post
 
 User = get_user_model()
 
@@ -63,3 +68,66 @@ class PostModelTest(TestCase):
             with self.subTest(value=value):
                 self.assertEqual(
                     post._meta.get_field(value).help_text, expected)
+
+
+class CounterModelTest(TestCase):
+    """ Проверяет хранимые счетчики постов."""
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание'
+        )
+        cls.another_group = Group.objects.create(
+            title='Тестовая группа 2',
+            slug='test-slug-2',
+            description='Тестовое описание 2'
+        )
+
+    def assertCounts(self, total, author, group, another_group):
+        self.assertEqual(get_posts_count(), total)
+        self.assertEqual(get_posts_count(author_id=self.user.pk), author)
+        self.assertEqual(get_posts_count(group_id=self.group.pk), group)
+        self.assertEqual(
+            get_posts_count(group_id=self.another_group.pk), another_group
+        )
+
+    def test_counters_follow_posts(self):
+        """ Счетчики меняются при создании, правке и удалении поста."""
+        self.assertCounts(0, 0, 0, 0)
+        post = Post.objects.create(
+            author=self.user, text='Тестовый пост', group=self.group
+        )
+        Post.objects.create(author=self.user, text='Тестовый пост 2')
+        self.assertCounts(2, 2, 1, 0)
+        post.group = self.another_group
+        post.save()
+        self.assertCounts(2, 2, 0, 1)
+        post.delete()
+        self.assertCounts(1, 1, 0, 0)
+
+    def test_recount_fixes_drift(self):
+        """ Команда recount исправляет разошедшиеся счетчики."""
+        Post.objects.bulk_create([
+            Post(author=self.user, text='Тестовый пост', group=self.group),
+            Post(author=self.user, text='Тестовый пост 2'),
+        ])
+        Counter.objects.update_or_create(
+            name=counter_name(author_id=self.user.pk),
+            defaults={'value': 5}
+        )
+        call_command('recount', stdout=StringIO())
+        self.assertCounts(2, 2, 1, 0)
+
+
+class FollowModelTest(TestCase):
+    def test_follow_is_unique(self):
+        """ Повторная подписка на того же автора запрещена на уровне БД."""
+        user = User.objects.create_user(username='auth')
+        author = User.objects.create_user(username='author')
+        Follow.objects.create(user=user, author=author)
+        with self.assertRaises(IntegrityError):
+            Follow.objects.create(user=user, author=author)
@@ -1,17 +1,35 @@
 from http import HTTPStatus
+from io import BytesIO, StringIO
 import shutil
 import tempfile
+from unittest import mock
 
 from django import forms
 from django.core.cache import cache
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
 from django.shortcuts import get_object_or_404
-from django.test import Client, TestCase, override_settings
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from PIL import Image
+from sorl.thumbnail import get_thumbnail
+from sorl.thumbnail.engines.pil_engine import Engine as PilEngine
+from sorl.thumbnail.images import ImageFile
 
-from posts.models import (Comment, Group, Post, Follow)
+from posts.cards import card_key
+from posts.counters import image_counter_name
+from posts.follows import followed_authors, followed_key, is_following
+from posts.models import (Comment, Counter, Group, Inbox, Post, Follow)
+from posts.timeline import pulled_authors, update_pulled_authors
+from posts.thumbnails import (FALLBACK, FORMATS, GEOMETRIES, geometries,
+                              image_formats, make_thumbnails,
+                              ready_thumbnail, thumbnail_names)
 
 User = get_user_model()
 NUMBER_OF_PAGINATED_POSTS = settings.PAGINATION_COUNT + 2
@@ -145,6 +163,120 @@ class PostViewsBigPagesTest(TestCase):
             self.assertEqual(len(response.context['page_obj'].object_list), 2)
 
 
+class PostViewsKeysetPaginationTest(TestCase):
+    """ Класс проверяет постраничный вывод по курсору (?after=/?before=)."""
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.posts = [
+            Post.objects.create(
+                author=cls.user,
+                text=f'Тестовый пост № {i+1} для проверки',
+            ) for i in range(NUMBER_OF_PAGINATED_POSTS)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cursor_pages(self):
+        """ Лента листается курсорами вперед и назад без COUNT."""
+        url = reverse('posts:profile', kwargs={'username': 'auth'})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        page_obj = response.context['page_obj']
+        self.assertTrue(page_obj.keyset)
+        self.assertEqual(
+            list(page_obj.object_list),
+            self.posts[::-1][:settings.PAGINATION_COUNT]
+        )
+        self.assertIsNone(page_obj.previous_cursor)
+        self.assertFalse(
+            any('COUNT' in query['sql'] for query in queries.captured_queries)
+        )
+        response = self.client.get(url, {'after': page_obj.next_cursor})
+        page_obj = response.context['page_obj']
+        self.assertEqual(
+            list(page_obj.object_list),
+            self.posts[::-1][settings.PAGINATION_COUNT:]
+        )
+        self.assertIsNone(page_obj.next_cursor)
+        response = self.client.get(url, {'before': page_obj.previous_cursor})
+        page_obj = response.context['page_obj']
+        self.assertEqual(
+            list(page_obj.object_list),
+            self.posts[::-1][:settings.PAGINATION_COUNT]
+        )
+        self.assertIsNone(page_obj.previous_cursor)
+
+    def test_old_page_links_and_bad_cursor(self):
+        """ Ссылки ?page=N работают, испорченный курсор дает первую страницу.
+        """
+        url = reverse('posts:profile', kwargs={'username': 'auth'})
+        response = self.client.get(url, {'page': 2})
+        self.assertEqual(response.context['page_obj'].number, 2)
+        self.assertEqual(len(response.context['page_obj'].object_list), 2)
+        response = self.client.get(url, {'after': 'испорчен'})
+        self.assertEqual(
+            response.context['page_obj'].object_list[0],
+            self.posts[-1]
+        )
+
+
+class PostViewsQueryCountTest(TestCase):
+    """ Число запросов страниц с лентами не зависит от размера страницы."""
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='reader')
+        authors = [
+            User.objects.create_user(
+                username=f'author_{i}', first_name='Имя', last_name=f'{i}'
+            ) for i in range(3)
+        ]
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание'
+        )
+        for author in authors:
+            Follow.objects.create(user=cls.user, author=author)
+        for i in range(NUMBER_OF_PAGINATED_POSTS):
+            Post.objects.create(
+                author=authors[i % len(authors)],
+                text=f'Тестовый пост № {i+1} для проверки',
+                group=cls.group,
+            )
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def count_queries(self, url, page_size):
+        cache.clear()
+        with override_settings(PAGINATION_COUNT=page_size):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.authorized_client.get(url)
+        self.assertEqual(len(response.context['page_obj']), page_size)
+        return len(queries)
+
+    def test_feed_query_count_is_constant(self):
+        """ Автор и группа карточек загружаются без запроса на каждый пост.
+        """
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': 'author_0'}),
+            reverse('posts:follow_index'),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(
+                    self.count_queries(url, 2),
+                    self.count_queries(url, 4)
+                )
+
+
 class PostViewsCreationEditionTest(TestCase):
     @classmethod
     def setUpClass(cls) -> None:
@@ -206,6 +338,9 @@ class PostViewsCreationEditionTest(TestCase):
             'posts:group_list': {'slug': self.group.slug},
         }
         for page, keyw in page_args.items():
+            # Страница общая для всех пользователей и уже могла попасть
+            # в кэш после редиректа автора - контекст нужен свежий
+            cache.clear()
             response = self.authorised_client.get(reverse(page, kwargs=keyw))
             first_post = response.context['page_obj'].object_list[0]
             self.assertEqual(first_post.text, post_data['text']),
@@ -260,6 +395,41 @@ class PostViewsCreationEditionTest(TestCase):
         self.assertNotIn(post, self.group.posts.all())
 
 
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_ASYNC=True)
+class PostThumbnailPoolTest(TransactionTestCase):
+    """ Класс проверяет публикацию картинки с включенным пулом
+        миниатюр на SQLite: транзакции запроса фиксируются, и пул
+        запускается сразу, как на настоящем сервере."""
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='auth')
+        self.client.force_login(self.user)
+
+    def test_create_post_with_image(self):
+        """ Пост с картинкой создается, миниатюры построены."""
+        buffer = BytesIO()
+        Image.new('RGB', (1200, 800), color=(0, 100, 0)).save(
+            buffer, 'JPEG'
+        )
+        response = self.client.post(reverse('posts:post_create'), {
+            'text': 'Пост с большой картинкой',
+            'image': SimpleUploadedFile(
+                'photo.jpg', buffer.getvalue(), content_type='image/jpeg'
+            ),
+        })
+        self.assertRedirects(
+            response,
+            reverse('posts:profile', kwargs={'username': 'auth'})
+        )
+        post = Post.objects.get()
+        self.assertIsNotNone(ready_thumbnail(post.image, FALLBACK))
+
+
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class PostViewsPictureTest(TestCase):
     """ Класс для проверки как отображаются и создаются посты с картинками."""
@@ -318,10 +488,7 @@ class PostViewsPictureTest(TestCase):
             'posts:post_detail',
             kwargs={'post_id': post.id}
         ))
-        self.assertEqual(
-            response.context['current_post'].image,
-            'posts/small.gif'
-        )
+        self.assertEqual(response.context['current_post'].image, post.image)
         # На страницах со списками постов
         page_args = {
             'posts:index': {},
@@ -331,7 +498,183 @@ class PostViewsPictureTest(TestCase):
         for page, keyw in page_args.items():
             response = self.authorised_client.get(reverse(page, kwargs=keyw))
             current_post = response.context['page_obj'].object_list[0]
-            self.assertEqual(current_post.image, 'posts/small.gif')
+            self.assertEqual(current_post.image, post.image)
+
+    def test_thumbnail_built_in_background(self):
+        """ Пока миниатюры нет, выводится заглушка, после построения
+            миниатюры страница сбрасывается и показывает ее."""
+        post = Post.objects.latest('id')
+        url = reverse('posts:post_detail', kwargs={'post_id': post.id})
+        response = self.client.get(url)
+        self.assertContains(response, 'img/placeholder.svg')
+        make_thumbnails(post.image.name)
+        response = self.client.get(url)
+        self.assertNotContains(response, 'img/placeholder.svg')
+        # По имени картинки (как в команде make_thumbnails) миниатюра
+        # тоже находится
+        self.assertIsNotNone(ready_thumbnail(post.image.name, FALLBACK))
+        self.assertContains(
+            response, ready_thumbnail(post.image, FALLBACK).url
+        )
+
+    def test_thumbnail_names_match_sorl(self):
+        """ Имена миниатюр, вычисленные без sorl (по его внутренним
+            функциям), совпадают с именами, которые строит sorl:
+            иначе после обновления sorl вместо картинок навсегда
+            останутся заглушки."""
+        post = Post.objects.latest('id')
+        self.assertEqual(thumbnail_names(post.image), [
+            get_thumbnail(post.image, geometry, **options).name
+            for geometry, options in GEOMETRIES.values()
+        ])
+
+    def test_legacy_image_keeps_thumbnails(self):
+        """ Миниатюры картинки, загруженной до хранилища по хэшу,
+            находятся по прежним именам и не удаляются media_gc."""
+        buffer = BytesIO()
+        Image.new('RGB', (20, 10), color=(200, 200, 0)).save(buffer, 'PNG')
+        name = default_storage.save('posts/legacy.png', BytesIO(
+            buffer.getvalue()
+        ))
+        # Так миниатюры строились, пока поле хранило файлы
+        # в default_storage
+        legacy = [
+            get_thumbnail(
+                ImageFile(name, default_storage), geometry, **options
+            ).name
+            for geometry, options in GEOMETRIES.values()
+        ]
+        post = Post.objects.create(
+            author=self.user, text='Старый пост', image=name
+        )
+        self.assertEqual(thumbnail_names(post.image), legacy)
+        self.assertEqual(thumbnail_names(name), legacy)
+        self.assertIsNotNone(ready_thumbnail(post.image, FALLBACK))
+        call_command('media_gc', '--min-age', '0', stdout=StringIO())
+        for thumbnail in [name] + legacy:
+            with self.subTest(name=thumbnail):
+                self.assertTrue(default_storage.exists(thumbnail))
+
+    def test_page_thumbnails_resolved_at_once(self):
+        """ Миниатюры всех постов страницы читаются из хранилища sorl
+            одним запросом."""
+        post = Post.objects.latest('id')
+        for i in range(3):
+            Post.objects.create(
+                author=self.user, text=f'Еще пост с картинкой № {i}',
+                image=post.image.name
+            )
+        make_thumbnails(post.image.name)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('posts:index'))
+        kvstore_queries = [
+            query for query in queries.captured_queries
+            if 'thumbnail_kvstore' in query['sql']
+        ]
+        self.assertEqual(len(kvstore_queries), 1)
+        # у каждого поста - набор ширин в srcset
+        self.assertContains(
+            response, f'{ready_thumbnail(post.image, FALLBACK).url} 900w',
+            count=4
+        )
+        self.assertContains(response, '360w', count=4 * len(FORMATS))
+
+    def test_webp_variants(self):
+        """ Если Pillow умеет WebP, строятся варианты WebP и страница
+            выводит их в <source>. Здесь Pillow может быть собран без
+            WebP, поэтому кодек подменяется: файл .webp пишется как PNG.
+        """
+        raw_data = PilEngine._get_raw_data
+
+        def save_webp_as_png(engine, image, format_, *args, **kwargs):
+            if format_ == 'WEBP':
+                format_ = 'PNG'
+            return raw_data(engine, image, format_, *args, **kwargs)
+
+        with mock.patch('posts.thumbnails.features.check', return_value=True):
+            formats = image_formats()
+        self.assertEqual(formats, ('webp', 'jpeg'))
+        post = Post.objects.latest('id')
+        with mock.patch.multiple(
+            'posts.thumbnails',
+            FORMATS=formats, GEOMETRIES=geometries(formats)
+        ), mock.patch.object(PilEngine, '_get_raw_data', save_webp_as_png):
+            make_thumbnails(post.image.name)
+            response = self.client.get(reverse('posts:index'))
+            webp = ready_thumbnail(post.image, 'post-360-webp')
+        self.assertTrue(webp.name.endswith('.webp'))
+        self.assertContains(response, '<source type="image/webp"')
+        self.assertContains(response, f'{webp.url} 360w')
+        self.assertContains(response, '.jpg 360w')
+
+    def test_media_gc_removes_orphans(self):
+        """ media_gc удаляет картинку удаленного поста и ее миниатюры,
+            а файлы картинок живых постов не трогает."""
+        post = Post.objects.latest('id')
+        make_thumbnails(post.image.name)
+        buffer = BytesIO()
+        Image.new('RGB', (20, 10), color=(0, 0, 200)).save(buffer, 'PNG')
+        orphan = Post.objects.create(
+            author=self.user, text='Пост, который будет удален',
+            image=SimpleUploadedFile(
+                'blue.png', buffer.getvalue(), content_type='image/png'
+            )
+        )
+        make_thumbnails(orphan.image.name)
+        orphan_files = [orphan.image.name] + thumbnail_names(orphan.image)
+        kept_files = [post.image.name] + thumbnail_names(post.image)
+        orphan.delete()
+        # Свежие файлы и пробный запуск ничего не удаляют
+        call_command('media_gc', stdout=StringIO())
+        dry_run = StringIO()
+        call_command('media_gc', '--min-age', '0', '--partitions', '3',
+                     '--dry-run', stdout=dry_run)
+        for name in orphan_files:
+            self.assertTrue(default_storage.exists(name))
+        output = StringIO()
+        call_command('media_gc', '--min-age', '0', '--partitions', '3',
+                     '--batch-size', '2', stdout=output)
+        # Пробный запуск насчитывает те же файлы, что удаляются
+        self.assertEqual(
+            dry_run.getvalue().split('удалено')[-1],
+            output.getvalue().split('Удалено')[-1]
+        )
+        for name in orphan_files:
+            with self.subTest(name=name):
+                self.assertFalse(default_storage.exists(name))
+        for name in kept_files:
+            with self.subTest(name=name):
+                self.assertTrue(default_storage.exists(name))
+        self.assertIsNone(ready_thumbnail(orphan_files[0], FALLBACK))
+        self.assertFalse(Counter.objects.filter(
+            name=image_counter_name(orphan_files[0])
+        ).exists())
+
+    def test_media_gc_quick_by_counters(self):
+        """ media_gc --quick удаляет картинки с нулевым счетчиком
+            ссылок и их миниатюры, не обходя файлы."""
+        post = Post.objects.latest('id')
+        buffer = BytesIO()
+        Image.new('RGB', (20, 10), color=(0, 200, 0)).save(buffer, 'PNG')
+        orphan = Post.objects.create(
+            author=self.user, text='Пост, который будет удален',
+            image=SimpleUploadedFile(
+                'green.png', buffer.getvalue(), content_type='image/png'
+            )
+        )
+        make_thumbnails(orphan.image.name)
+        orphan_files = [orphan.image.name] + thumbnail_names(orphan.image)
+        orphan.delete()
+        counter = image_counter_name(orphan_files[0])
+        self.assertEqual(Counter.objects.get(name=counter).value, 0)
+        call_command('media_gc', '--quick', '--min-age', '0',
+                     stdout=StringIO())
+        for name in orphan_files:
+            with self.subTest(name=name):
+                self.assertFalse(default_storage.exists(name))
+        self.assertTrue(default_storage.exists(post.image.name))
+        self.assertFalse(Counter.objects.filter(name=counter).exists())
 
 
 class PostViewsCommentsTest(TestCase):
@@ -366,6 +709,75 @@ class PostViewsCommentsTest(TestCase):
         self.assertIn(self.comment, response.context['comments'])
 
 
+@override_settings(COMMENTS_PAGINATION_COUNT=3)
+class PostViewsCommentsPaginationTest(TestCase):
+    """ Класс проверяет постраничный вывод комментариев к посту."""
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        author = User.objects.create_user(username='post_author')
+        cls.post = Post.objects.create(author=author, text='Тестовый пост')
+        for i in range(7):
+            Comment.objects.create(
+                author=User.objects.create_user(username=f'commentator{i}'),
+                post=cls.post,
+                text=f'Комментарий № {i}'
+            )
+        cls.comments = list(
+            cls.post.comments.order_by('-created', '-id')
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_comments_loaded_by_cursor(self):
+        """ На странице поста первые комментарии, остальные
+            подгружаются фрагментами, авторы - тем же запросом."""
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        )
+        page = response.context['comments']
+        loaded = list(page)
+        self.assertEqual(loaded, self.comments[:3])
+        while page.next_cursor:
+            url = reverse(
+                'posts:post_comments', kwargs={'post_id': self.post.pk}
+            )
+            self.assertContains(response, f'{url}?after={page.next_cursor}')
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, {'after': page.next_cursor})
+            self.assertTemplateUsed(response, 'posts/includes/comments.html')
+            comment_queries = [
+                query['sql'] for query in queries.captured_queries
+                if 'posts_comment' in query['sql']
+            ]
+            self.assertEqual(len(comment_queries), 1)
+            self.assertIn('auth_user', comment_queries[0])
+            page = response.context['comments']
+            loaded.extend(page)
+        self.assertEqual(loaded, self.comments)
+
+    def test_bench_queries_runs_view_query(self):
+        """ bench_queries замеряет тот же запрос комментариев, что
+            выполняет страница поста, и не заполняет рабочую базу."""
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(
+                reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+            )
+        view_sql = [
+            query['sql'] for query in queries.captured_queries
+            if 'posts_comment' in query['sql']
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            call_command('bench_queries', '--repeat', '1', stdout=StringIO())
+        bench_sql = {query['sql'] for query in queries.captured_queries}
+        self.assertEqual(len(view_sql), 1)
+        self.assertIn(view_sql[0], bench_sql)
+        with self.assertRaises(CommandError):
+            call_command('bench_queries', '--seed', stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 1)
+
+
 class PostTemlatesCacheTest(TestCase):
     """ Класс проверяет как работает кэширование информации."""
     @classmethod
@@ -393,16 +805,126 @@ class PostTemlatesCacheTest(TestCase):
         cache.clear()
 
     def test_cache_index_page(self):
-        """ Проверка кеширования списка постов на главной странице """
+        """ Главная страница отдается из кэша, пока посты не менялись,
+            и обновляется сразу после записи в БД."""
         response = self.client.get(reverse('posts:index'))
+        # повторный запрос - страница из кэша, рендерятся только «дырки»
+        response_cached = self.client.get(reverse('posts:index'))
+        self.assertTemplateNotUsed(response_cached, 'posts/index.html')
+        self.assertEqual(response.content, response_cached.content)
         Post.objects.create(
             author=self.user1,
-            text='Тестовый пост для проверки кэширования',
+            text='Новый пост',
         )
-        # проверка сразу после добавления поста в БД
-        # страница не изменилась, данные поступают из кэша
-        response_cached = self.client.get(reverse('posts:index'))
-        self.assertEqual(response.content, response_cached.content)
+        # после добавления поста кэш страницы сброшен
+        response_new = self.client.get(reverse('posts:index'))
+        self.assertTemplateUsed(response_new, 'posts/index.html')
+        self.assertContains(
+            response_new, 'Новый пост'
+        )
+
+    def test_warm_cache(self):
+        """ После прогрева страницы отдаются из кэша без рендера."""
+        out = StringIO()
+        call_command('warm_cache', '--concurrency', '1', stdout=out)
+        self.assertIn('с ошибкой: 0', out.getvalue())
+        urls = {
+            reverse('posts:index'): 'posts/index.html',
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}):
+                'posts/group_list.html',
+            reverse('posts:profile', kwargs={'username': 'simple_user'}):
+                'posts/profile.html',
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}):
+                'posts/post_detail.html',
+        }
+        for url, template in urls.items():
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertTemplateNotUsed(response, template)
+
+    def test_conditional_get(self):
+        """ Неизменившаяся страница отдается ответом 304 по ETag,
+            после нового поста - целиком. Last-Modified (с точностью
+            до секунды) не отправляется и не проверяется."""
+        url = reverse('posts:profile', kwargs={'username': 'simple_user'})
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertFalse(response.has_header('Last-Modified'))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        response = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE='Sat, 01 Jan 2050 00:00:00 GMT'
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        Post.objects.create(author=self.user, text='Новый пост')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_shared_page_with_user_holes(self):
+        """ Страница кэшируется одна на всех, а кнопка подписки,
+            форма комментария и ссылка на правку - у каждого свои."""
+        follower = Client()
+        follower.force_login(self.user1)
+        author = Client()
+        author.force_login(self.user)
+        profile_url = reverse(
+            'posts:profile', kwargs={'username': 'simple_user'}
+        )
+        self.assertNotContains(self.client.get(profile_url), 'Подписаться')
+        response = follower.get(profile_url)
+        self.assertTemplateNotUsed(response, 'posts/profile.html')
+        self.assertContains(response, 'Подписаться')
+        self.assertNotContains(author.get(profile_url), 'Подписаться')
+        post_url = reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.id}
+        )
+        response = self.client.get(post_url)
+        self.assertNotContains(response, 'Добавить комментарий')
+        response = follower.get(post_url)
+        self.assertTemplateNotUsed(response, 'posts/post_detail.html')
+        self.assertContains(response, 'Добавить комментарий')
+        self.assertContains(response, 'csrfmiddlewaretoken')
+        self.assertNotContains(response, 'Редактировать')
+        self.assertContains(author.get(post_url), 'Редактировать')
+
+    def test_cache_group_page_after_group_change(self):
+        """ Страница группы обновляется после правки группы."""
+        url = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        self.client.get(url)
+        self.group.description = 'Новое описание'
+        self.group.save()
+        self.assertContains(self.client.get(url), 'Новое описание')
+
+    def test_cached_post_page_without_queries(self):
+        """ Закэшированные страницы поста и профиля отдаются гостю
+            без запросов к БД, а новый пост автора обновляет обе."""
+        urls = {
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}):
+                'Всего постов автора:  <span >2</span>',
+            reverse('posts:profile', kwargs={'username': 'simple_user'}):
+                'Всего постов: 2',
+        }
+        for url in urls:
+            self.client.get(url)
+            with self.subTest(url=url), self.assertNumQueries(0):
+                self.client.get(url)
+        Post.objects.create(author=self.user, text='Новый пост')
+        for url, posts_count in urls.items():
+            with self.subTest(url=url):
+                self.assertContains(self.client.get(url), posts_count)
+
+    def test_cache_post_page_after_comment(self):
+        """ Страница поста обновляется после нового комментария."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        self.client.get(url)
+        Comment.objects.create(
+            author=self.user1,
+            post=self.post,
+            text='Новый комментарий',
+        )
+        self.assertContains(self.client.get(url), 'Новый комментарий')
 
 
 class PostViewFollowTest(TestCase):
@@ -419,9 +941,19 @@ class PostViewFollowTest(TestCase):
         )
 
     def setUp(self):
+        cache.clear()
         self.authorised_client = Client()
         self.authorised_client.force_login(self.user1)
 
+    def test_follow_set_read_before_follow_is_not_reused(self):
+        """ Множество подписок, прочитанное до подписки и положенное
+            в кэш после нее, не используется."""
+        stale_key = followed_key(self.user1.pk)
+        stale = followed_authors(self.user1.pk)
+        Follow.objects.create(user=self.user1, author=self.user_author)
+        cache.set(stale_key, stale)
+        self.assertTrue(is_following(self.user1, self.user_author.pk))
+
     def test_authorised_user_can_follow(self):
         """Авторизованный пользователь может может подписываться
         на других пользователей и удалять их из подписок"""
@@ -476,3 +1008,245 @@ class PostViewFollowTest(TestCase):
         # На странице "избранные авторы" должен отсутствовать пост автора
         response = self.authorised_client.get(reverse('posts:follow_index'))
         self.assertNotIn(self.post, response.context['page_obj'].object_list)
+
+    def test_new_post_fans_out_to_followers_inbox(self):
+        """ Новый пост автора попадает в ленту Inbox подписчика,
+            а команда rebuild_inboxes восстанавливает ленту."""
+        Follow.objects.create(user=self.user1, author=self.user_author)
+        new_post = Post.objects.create(
+            author=self.user_author,
+            text='Тестовый текст № 2'
+        )
+        self.assertEqual(
+            list(Inbox.objects.filter(user=self.user1).values_list(
+                'post_id', flat=True
+            )),
+            [new_post.id, self.post.id]
+        )
+        Inbox.objects.all().delete()
+        call_command('rebuild_inboxes', stdout=StringIO())
+        response = self.authorised_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj'].object_list),
+            [new_post, self.post]
+        )
+
+    def test_follow_set_is_cached(self):
+        """ Множество подписок читается из БД один раз
+            и сбрасывается при подписке и отписке."""
+        self.assertFalse(is_following(self.user1, self.user_author.pk))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertFalse(is_following(self.user1, self.user_author.pk))
+        self.assertEqual(len(queries), 0)
+        Follow.objects.create(user=self.user1, author=self.user_author)
+        self.assertTrue(is_following(self.user1, self.user_author.pk))
+        Follow.objects.filter(user=self.user1).delete()
+        self.assertFalse(is_following(self.user1, self.user_author.pk))
+
+    @override_settings(FOLLOW_FEED_REFRESH_ASYNC=False)
+    def test_feed_head_cached_with_stale_while_revalidate(self):
+        """ Начало ленты берется из кэша; после нового поста один раз
+            отдается устаревшая копия, а после подписки - сразу новая."""
+        Follow.objects.create(user=self.user1, author=self.user_author)
+        url = reverse('posts:follow_index')
+        self.authorised_client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.authorised_client.get(url)
+        self.assertFalse(
+            any('posts_inbox' in query['sql'] for query in queries)
+        )
+        self.assertEqual(list(response.context['page_obj']), [self.post])
+        new_post = Post.objects.create(
+            author=self.user_author,
+            text='Тестовый текст № 2'
+        )
+        response = self.authorised_client.get(url)
+        self.assertEqual(list(response.context['page_obj']), [self.post])
+        response = self.authorised_client.get(url)
+        self.assertEqual(
+            list(response.context['page_obj']), [new_post, self.post]
+        )
+        another_author = User.objects.create_user(username='another_author')
+        another_post = Post.objects.create(
+            author=another_author,
+            text='Тестовый текст № 3'
+        )
+        Follow.objects.create(user=self.user1, author=another_author)
+        response = self.authorised_client.get(url)
+        self.assertEqual(
+            list(response.context['page_obj']),
+            [another_post, new_post, self.post]
+        )
+
+    @override_settings(FOLLOW_FEED_REFRESH_ASYNC=True)
+    def test_feed_head_refreshed_with_pool_enabled(self):
+        """ С включенным пулом пересборки начало ленты обновляется
+            (на SQLite - в том же запросе) без ошибок блокировки БД."""
+        Follow.objects.create(user=self.user1, author=self.user_author)
+        url = reverse('posts:follow_index')
+        self.authorised_client.get(url)
+        new_post = Post.objects.create(
+            author=self.user_author, text='Тестовый текст № 2'
+        )
+        self.authorised_client.get(url)
+        response = self.authorised_client.get(url)
+        self.assertEqual(
+            list(response.context['page_obj']), [new_post, self.post]
+        )
+
+    def test_bench_follow_feed_reads_inbox(self):
+        """ Замер ленты читает диапазон Inbox при каждом повторе,
+            а не закэшированное начало ленты."""
+        Follow.objects.create(user=self.user1, author=self.user_author)
+        with CaptureQueriesContext(connection) as queries:
+            call_command(
+                'bench_follow_feed', 'simple_user', '--repeat', '3',
+                stdout=StringIO()
+            )
+        inbox_queries = [
+            query for query in queries.captured_queries
+            if 'posts_inbox' in query['sql']
+        ]
+        self.assertEqual(len(inbox_queries), 3)
+
+    @override_settings(FEED_FANOUT_THRESHOLD=2)
+    def test_pulled_author_posts_merged_into_feed(self):
+        """ Посты автора с большим числом подписчиков не раскладываются
+            по лентам, но попадают в ленту при чтении в нужном порядке."""
+        cache.clear()
+        another_user = User.objects.create_user(username='another_user')
+        light_author = User.objects.create_user(username='light_author')
+        Follow.objects.create(user=another_user, author=self.user_author)
+        Follow.objects.create(user=self.user1, author=self.user_author)
+        Follow.objects.create(user=self.user1, author=light_author)
+        cache.clear()
+        # Запросы не пересчитывают «тяжелых» авторов - только команда
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(pulled_authors(), frozenset())
+        self.assertFalse(
+            any('GROUP BY' in query['sql'] for query in queries)
+        )
+        cache.clear()
+        call_command('update_pulled_authors', stdout=StringIO())
+        posts = [self.post]
+        for i in range(settings.PAGINATION_COUNT):
+            posts.append(Post.objects.create(
+                author=(self.user_author, light_author)[i % 2],
+                text=f'Тестовый текст № {i+2}'
+            ))
+        # Старый пост автора уже был в ленте до того, как автор
+        # стал «тяжелым» - в выдаче он не должен задвоиться
+        self.assertFalse(
+            Inbox.objects.filter(
+                post__author=self.user_author
+            ).exclude(post=self.post).exists()
+        )
+        response = self.authorised_client.get(reverse('posts:follow_index'))
+        page_obj = response.context['page_obj']
+        self.assertEqual(list(page_obj.object_list), posts[::-1][:-1])
+        response = self.authorised_client.get(
+            reverse('posts:follow_index'), {'after': page_obj.next_cursor}
+        )
+        self.assertEqual(list(response.context['page_obj']), [self.post])
+
+    @override_settings(
+        FEED_FANOUT_THRESHOLD=3, FEED_FANOUT_RELEASE_THRESHOLD=2,
+        FOLLOW_FEED_REFRESH_ASYNC=False
+    )
+    def test_pulled_author_crosses_threshold_both_ways(self):
+        """ Автор становится «тяжелым» на верхнем пороге, остается им
+            до нижнего, а выйдя из множества, раскладывает по лентам
+            и посты, вышедшие, пока он был «тяжелым»."""
+        followers = [self.user1] + [
+            User.objects.create_user(username=f'follower_{i}')
+            for i in range(2)
+        ]
+        for user in followers:
+            Follow.objects.create(user=user, author=self.user_author)
+        self.assertIn(self.user_author.pk, update_pulled_authors())
+        pulled_post = Post.objects.create(
+            author=self.user_author, text='Пост «тяжелого» автора'
+        )
+        self.assertFalse(Inbox.objects.filter(post=pulled_post).exists())
+        url = reverse('posts:follow_index')
+        feed = [pulled_post, self.post]
+        self.assertEqual(
+            list(self.authorised_client.get(url).context['page_obj']), feed
+        )
+        # Между порогами автор остается «тяжелым»
+        Follow.objects.filter(user=followers[2]).delete()
+        self.assertIn(self.user_author.pk, update_pulled_authors())
+        self.assertFalse(Inbox.objects.filter(post=pulled_post).exists())
+        # Ниже нижнего порога его посты разложены по лентам
+        Follow.objects.filter(user=followers[1]).delete()
+        self.assertNotIn(self.user_author.pk, update_pulled_authors())
+        self.assertEqual(
+            list(Inbox.objects.filter(
+                post=pulled_post
+            ).values_list('user_id', flat=True)),
+            [self.user1.pk]
+        )
+        released_post = Post.objects.create(
+            author=self.user_author, text='Пост после выхода из множества'
+        )
+        self.assertTrue(
+            Inbox.objects.filter(user=self.user1, post=released_post).exists()
+        )
+        self.assertEqual(
+            list(self.authorised_client.get(url).context['page_obj']),
+            [released_post] + feed
+        )
+        # И снова «тяжелый» на верхнем пороге
+        for user in followers[1:]:
+            Follow.objects.create(user=user, author=self.user_author)
+        self.assertIn(self.user_author.pk, update_pulled_authors())
+        another_post = Post.objects.create(
+            author=self.user_author, text='Снова пост «тяжелого» автора'
+        )
+        self.assertFalse(Inbox.objects.filter(post=another_post).exists())
+        # Начало ленты устарело: один раз отдается прежняя копия
+        self.authorised_client.get(url)
+        self.assertEqual(
+            list(self.authorised_client.get(url).context['page_obj']),
+            [another_post, released_post] + feed
+        )
+
+
+class PostCardCacheTest(TestCase):
+    """ Класс проверяет кэш карточек постов и его сброс."""
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='simple_user')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание'
+        )
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text='Тестовый пост',
+            group=cls.group,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_card_is_cached_and_invalidated(self):
+        """ Карточка кэшируется и сбрасывается при правке поста
+            и переименовании группы."""
+        key = card_key(self.post.pk)
+        url = reverse('posts:profile', kwargs={'username': 'simple_user'})
+        self.client.get(url)
+        html, _, _ = cache.get(key)
+        self.assertIn('Тестовый пост', html)
+        self.post.text = 'Новый текст'
+        self.post.save()
+        self.assertIsNone(cache.get(key))
+        response = self.client.get(url)
+        self.assertContains(response, 'Новый текст')
+        self.group.title = 'Новое название'
+        self.group.save()
+        self.assertIsNone(cache.get(key))
+        response = self.client.get(url)
+        self.assertContains(response, 'Новое название')
@@ -0,0 +1,192 @@
+import logging
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import features
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+
+from core import background
+from core.storage import content_digest
+
+from . import cards, page_cache
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+# Ширины вариантов картинки поста для srcset (пропорции 900x550)
+WIDTHS = (360, 600, 900)
+
+
+def image_formats():
+    """ Форматы вариантов: WebP строится, только если Pillow собран
+        с его поддержкой; JPEG нужен всегда - это запасной вариант
+        для старых браузеров."""
+    return ('webp', 'jpeg') if features.check('webp') else ('jpeg',)
+
+
+def variant_name(width, image_format):
+    return f'post-{width}-{image_format}'
+
+
+def geometries(formats):
+    """ Миниатюры, которые выводят шаблоны:
+        имя -> (геометрия, опции)."""
+    return {
+        variant_name(width, image_format): (
+            f'{width}x{width * 550 // 900}',
+            {
+                'crop': 'center', 'upscale': True,
+                'format': image_format.upper(),
+            }
+        )
+        for width in WIDTHS for image_format in formats
+    }
+
+
+FORMATS = image_formats()
+GEOMETRIES = geometries(FORMATS)
+# Без этой миниатюры вместо картинки выводится заглушка
+FALLBACK = variant_name(900, 'jpeg')
+
+
+def _options(source, options):
+    # Те же опции по умолчанию, что добавляет sorl в get_thumbnail:
+    # от них зависит имя файла миниатюры
+    backend = default.backend
+    options = dict(options)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    return options
+
+
+def _source(image):
+    # Хранилище входит в ключ sorl (а значит, и в имя миниатюры):
+    # картинка, переданная именем, открывается в хранилище поля
+    # Post.image, как и файл поля (post.image). Картинки, загруженные
+    # до хранилища по хэшу (core.storage), лежат в той же папке MEDIA,
+    # но их миниатюры построены с ключом default_storage - с ним
+    # они и ищутся, иначе у старых постов сменились бы имена миниатюр
+    name = getattr(image, 'name', image)
+    if content_digest(name) is None:
+        return ImageFile(name, default_storage)
+    return ImageFile(name, Post._meta.get_field('image').storage)
+
+
+def _thumbnail_file(image, name):
+    geometry, options = GEOMETRIES[name]
+    source = _source(image)
+    filename = default.backend._get_thumbnail_filename(
+        source, geometry, _options(source, options)
+    )
+    return ImageFile(filename, default.storage)
+
+
+def thumbnail_names(image):
+    """ Имена файлов миниатюр картинки всех размеров GEOMETRIES
+        (файлов может еще не быть)."""
+    return [_thumbnail_file(image, name).name for name in GEOMETRIES]
+
+
+def forget_image(image, delete_thumbnails=True):
+    """ Убирает картинку из хранилища ключей sorl вместе с известными
+        ему миниатюрами. Файлы миниатюр удаляются, только если
+        delete_thumbnails: иначе их удаляет сам вызывающий
+        (forget_thumbnail для каждой)."""
+    source = _source(image)
+    default.kvstore.delete(source, delete_thumbnails=delete_thumbnails)
+    if not delete_thumbnails:
+        # Список миниатюр картинки больше не нужен
+        default.kvstore._delete(source.key, identity='thumbnails')
+
+
+def forget_thumbnail(name):
+    """ Убирает миниатюру из хранилища ключей sorl: иначе страница
+        выведет ее и после удаления файла."""
+    default.kvstore.delete(
+        ImageFile(name, default.storage), delete_thumbnails=False
+    )
+
+
+def ready_thumbnail(image, name):
+    """ Готовая миниатюра размера name или None.
+        Миниатюра ищется только в хранилище ключей sorl: ни файл
+        картинки, ни Pillow не нужны, поэтому запрос не строит
+        миниатюру сам, а выводит заглушку, пока ее строит пул
+        (см. schedule).
+    """
+    return default.kvstore.get(_thumbnail_file(image, name))
+
+
+def image_variants(posts):
+    """ Готовые варианты картинок постов страницы:
+        {id поста: {'src': адрес JPEG 900, 'webp': srcset, 'jpeg': srcset}}.
+        Все варианты всех постов читаются из хранилища sorl разом
+        (posts.kvstore).
+        Посты без готового запасного варианта (FALLBACK) в словарь
+        не попадают - для них выводится заглушка.
+    """
+    files = {
+        (post.pk, name): _thumbnail_file(post.image, name)
+        for post in posts if post.image for name in GEOMETRIES
+    }
+    found = default.kvstore.get_many(list(files.values())) if files else []
+    ready = {key: file for key, file in zip(files, found) if file}
+    variants = {}
+    for pk in {pk for pk, name in ready if name == FALLBACK}:
+        variants[pk] = {'src': ready[pk, FALLBACK].url}
+        for image_format in FORMATS:
+            variants[pk][image_format] = ', '.join(
+                f'{ready[pk, variant_name(width, image_format)].url} {width}w'
+                for width in WIDTHS
+                if (pk, variant_name(width, image_format)) in ready
+            )
+    return variants
+
+
+def make_thumbnails(image_name):
+    """ Строит миниатюры всех размеров и сбрасывает кэш страниц
+        с постами этой картинки: вместо заглушки появится миниатюра."""
+    source = _source(image_name)
+    for geometry, options in GEOMETRIES.values():
+        get_thumbnail(source, geometry, **options)
+    posts = list(
+        Post.objects.filter(image=image_name).select_related('author')
+    )
+    cards.invalidate_cards([post.pk for post in posts])
+    for post in posts:
+        page_cache.bump_post(post, [post.group_id])
+
+
+def _make_logged(image_name):
+    # Ошибка в картинке не должна ронять ни запрос, ни поток пула
+    try:
+        make_thumbnails(image_name)
+    except Exception:
+        logger.exception('Не удалось построить миниатюры %s', image_name)
+
+
+def enqueue(image_name):
+    """ Ставит картинку в очередь пула потоков построения миниатюр.
+        Без THUMBNAIL_ASYNC (и с SQLite, см. core.background)
+        миниатюры строятся сразу."""
+    if not settings.THUMBNAIL_ASYNC:
+        _make_logged(image_name)
+        return
+    background.submit(
+        'thumbnails', settings.THUMBNAIL_WORKERS, _make_logged, image_name
+    )
+
+
+def schedule(image_name):
+    """ Построит миниатюры, когда пост с картинкой сохранится в БД."""
+    transaction.on_commit(lambda: enqueue(image_name))
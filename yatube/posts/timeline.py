@@ -0,0 +1,363 @@
+import heapq
+import time
+import uuid
+from itertools import groupby, islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+
+from core import background
+
+from .follows import followed_authors
+from .models import Follow, Inbox, Post, PulledAuthor
+from .paginators import KeysetPaginator, seek_queryset
+
+PULLED_AUTHORS_KEY = 'timeline:pulled_authors'
+# Закэшированное начало ленты пользователя и его версия
+HEAD_KEY = 'timeline:head:{}'
+VERSION_KEY = 'timeline:version:{}'
+# Время последнего поста «тяжелого» автора
+AUTHOR_POSTED_KEY = 'timeline:posted:{}'
+REFRESH_LOCK_KEY = 'timeline:refresh:{}'
+
+
+def pulled_authors():
+    """ Множество id «тяжелых» авторов (таблица PulledAuthor).
+        Их посты не раскладываются по лентам, а подмешиваются в ленту
+        подписчика при чтении. Множество читается из кэша, при промахе -
+        из небольшой таблицы; пересчитывает его по таблице Follow
+        только команда update_pulled_authors (см. update_pulled_authors),
+        а не запросы.
+    """
+    authors = cache.get(PULLED_AUTHORS_KEY)
+    if authors is None:
+        authors = frozenset(
+            PulledAuthor.objects.values_list('author_id', flat=True)
+        )
+        cache.set(
+            PULLED_AUTHORS_KEY, authors, settings.FEED_PULLED_AUTHORS_TIMEOUT
+        )
+    return authors
+
+
+def update_pulled_authors():
+    """ Пересчитывает «тяжелых» авторов по таблице Follow.
+        Автор становится «тяжелым», когда подписчиков у него не меньше
+        FEED_FANOUT_THRESHOLD, и перестает им быть, только когда их
+        меньше FEED_FANOUT_RELEASE_THRESHOLD: автор у самого порога
+        не переключается туда и обратно. Посты вышедшего из множества
+        автора раскладываются по лентам (release_author).
+        Пересчет (GROUP BY по всем подпискам и раскладка) тяжелый,
+        поэтому его выполняет периодическая команда, а не запросы.
+    """
+    release = min(
+        settings.FEED_FANOUT_RELEASE_THRESHOLD, settings.FEED_FANOUT_THRESHOLD
+    )
+    previous = set(PulledAuthor.objects.values_list('author_id', flat=True))
+    followers = dict(
+        Follow.objects.values('author').annotate(
+            followers=Count('pk')
+        ).filter(
+            followers__gte=release
+        ).values_list('author', 'followers')
+    )
+    authors = frozenset(
+        author_id for author_id, count in followers.items()
+        if count >= settings.FEED_FANOUT_THRESHOLD or author_id in previous
+    )
+    PulledAuthor.objects.bulk_create(
+        [
+            PulledAuthor(author_id=author_id, followers=followers[author_id])
+            for author_id in authors - previous
+        ],
+        ignore_conflicts=True
+    )
+    for author_id in previous - authors:
+        release_author(author_id)
+    cache.set(
+        PULLED_AUTHORS_KEY, authors, settings.FEED_PULLED_AUTHORS_TIMEOUT
+    )
+    return authors
+
+
+def is_pulled(author_id):
+    """ Не раскладывать ли посты автора по лентам.
+        Кэш множества может отставать от таблицы, поэтому решение
+        проверяется по ней: пост автора, только что вышедшего
+        из множества, не должен пропасть из лент.
+    """
+    return author_id in pulled_authors() and PulledAuthor.objects.filter(
+        author_id=author_id
+    ).exists()
+
+
+def release_author(author_id):
+    """ Раскладывает по лентам подписчиков посты автора, который
+        перестал быть «тяжелым», в том числе вышедшие, пока он им был."""
+    with transaction.atomic():
+        # Отметку снимает только один из параллельных пересчетов;
+        # новые посты автора с этого момента раскладываются сами
+        deleted, _ = PulledAuthor.objects.filter(author_id=author_id).delete()
+        if not deleted:
+            return
+        followers = Follow.objects.filter(
+            author_id=author_id
+        ).values_list('user_id', flat=True)
+        for user_id in followers.iterator():
+            add_author(user_id, author_id)
+
+
+def _batches(iterable):
+    iterable = iter(iterable)
+    while True:
+        batch = list(islice(iterable, settings.INBOX_BATCH_SIZE))
+        if not batch:
+            break
+        yield batch
+
+
+def _bulk_add(entries):
+    """ Записывает элементы ленты пачками, повторы пропускаются."""
+    for batch in _batches(entries):
+        Inbox.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def fan_out_post(post):
+    """ Раскладывает новый пост в ленты всех подписчиков автора."""
+    if is_pulled(post.author_id):
+        author_posted(post.author_id)
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    for user_ids in _batches(followers.iterator()):
+        Inbox.objects.bulk_create(
+            [
+                Inbox(user_id=user_id, post_id=post.pk, pub_date=post.pub_date)
+                for user_id in user_ids
+            ],
+            ignore_conflicts=True
+        )
+        mark_stale(user_ids)
+
+
+def post_removed(post):
+    """ Помечает устаревшими ленты, в которых был удаленный пост
+        (сами записи Inbox удаляются каскадно)."""
+    if is_pulled(post.author_id):
+        author_posted(post.author_id)
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    for user_ids in _batches(followers.iterator()):
+        mark_stale(user_ids)
+
+
+def add_author(user_id, author_id):
+    """ Добавляет в ленту пользователя все посты автора (при подписке)."""
+    drop_head(user_id)
+    if is_pulled(author_id):
+        return
+    posts = Post.objects.filter(
+        author_id=author_id
+    ).values_list('pk', 'pub_date')
+    _bulk_add(
+        Inbox(user_id=user_id, post_id=post_id, pub_date=pub_date)
+        for post_id, pub_date in posts.iterator()
+    )
+
+
+def remove_author(user_id, author_id):
+    """ Убирает из ленты пользователя посты автора (при отписке)."""
+    Inbox.objects.filter(user_id=user_id, post__author_id=author_id).delete()
+    drop_head(user_id)
+
+
+def rebuild_inbox(user_id):
+    """ Собирает ленту пользователя заново по таблице Follow."""
+    Inbox.objects.filter(user_id=user_id).delete()
+    authors = Follow.objects.filter(
+        user_id=user_id
+    ).values_list('author_id', flat=True)
+    for author_id in authors:
+        add_author(user_id, author_id)
+    drop_head(user_id)
+
+
+def _new_version():
+    return uuid.uuid4().hex[:12]
+
+
+def mark_stale(user_ids):
+    """ Мягкий сброс: закэшированное начало ленты еще можно отдать,
+        но при чтении оно будет пересобрано в фоне."""
+    version = _new_version()
+    cache.set_many(
+        {VERSION_KEY.format(user_id): version for user_id in user_ids},
+        settings.FOLLOW_FEED_CACHE_TIMEOUT
+    )
+
+
+def author_posted(author_id):
+    # Подписчиков у «тяжелого» автора слишком много, чтобы помечать
+    # каждую ленту: ленты сравнивают время своей сборки с этой отметкой
+    cache.set(
+        AUTHOR_POSTED_KEY.format(author_id), time.time(),
+        settings.FOLLOW_FEED_CACHE_TIMEOUT
+    )
+
+
+def drop_head(user_id):
+    """ Жесткий сброс (изменились подписки): старое начало ленты
+        больше не отдается. Версия тоже меняется, чтобы устаревшей
+        считалась и лента, которую в этот момент собирает фоновый поток.
+    """
+    cache.delete(HEAD_KEY.format(user_id))
+    mark_stale([user_id])
+
+
+def _followed_pulled(user_id):
+    """ Авторы из подписок пользователя, чьи посты читаются напрямую."""
+    pulled = pulled_authors()
+    if not pulled:
+        return []
+    return sorted(pulled & followed_authors(user_id))
+
+
+def _seek_keys(user_id, authors, cursor, forward, limit):
+    """ Ключи (pub_date, id) постов ленты за курсором: слияние записей
+        Inbox и постов «тяжелых» авторов authors."""
+    streams = [
+        seek_queryset(
+            Inbox.objects.filter(user_id=user_id),
+            ('pub_date', 'post_id'), cursor, forward
+        ).values_list('pub_date', 'post_id')[:limit]
+    ]
+    if authors:
+        streams.append(
+            seek_queryset(
+                Post.objects.filter(author_id__in=authors),
+                ('pub_date', 'id'), cursor, forward
+            ).values_list('pub_date', 'id')[:limit]
+        )
+    merged = heapq.merge(*streams, reverse=forward)
+    # Пост мог попасть в оба потока, если автор стал «тяжелым»
+    # уже после раскладки - одинаковые ключи идут подряд
+    return [key for key, _ in islice(groupby(merged), limit)]
+
+
+def build_head(user_id):
+    """ Собирает и кэширует ключи первых FOLLOW_FEED_CACHED_PAGES
+        страниц ленты."""
+    version = cache.get(VERSION_KEY.format(user_id))
+    built = time.time()
+    limit = settings.FOLLOW_FEED_CACHED_PAGES * settings.PAGINATION_COUNT + 1
+    authors = _followed_pulled(user_id)
+    keys = _seek_keys(user_id, authors, None, True, limit)
+    head = {
+        'keys': keys,
+        # В ленте меньше постов, чем помещается в кэш, - она вся здесь
+        'complete': len(keys) < limit,
+        'authors': authors,
+        'version': version,
+        'built': built,
+    }
+    cache.set(
+        HEAD_KEY.format(user_id), head, settings.FOLLOW_FEED_CACHE_TIMEOUT
+    )
+    return head
+
+
+def _is_stale(user_id, head):
+    # Автор из подписок стал «тяжелым» или перестал им быть
+    if _followed_pulled(user_id) != head['authors']:
+        return True
+    keys = [VERSION_KEY.format(user_id)] + [
+        AUTHOR_POSTED_KEY.format(author_id) for author_id in head['authors']
+    ]
+    marks = cache.get_many(keys)
+    if marks.get(keys[0]) != head['version']:
+        return True
+    return any(marks.get(key, 0) > head['built'] for key in keys[1:])
+
+
+def _refresh(user_id, lock):
+    try:
+        build_head(user_id)
+    finally:
+        cache.delete(lock)
+
+
+def refresh_head(user_id):
+    """ Пересобирает начало ленты; одновременно - не больше одной
+        пересборки на пользователя. С FOLLOW_FEED_REFRESH_ASYNC
+        пересборка идет в пуле из FOLLOW_FEED_REFRESH_WORKERS потоков
+        (с SQLite - сразу, см. core.background)."""
+    lock = REFRESH_LOCK_KEY.format(user_id)
+    if not cache.add(lock, True, settings.FOLLOW_FEED_REFRESH_LOCK_TIMEOUT):
+        return
+    if not settings.FOLLOW_FEED_REFRESH_ASYNC:
+        _refresh(user_id, lock)
+        return
+    background.submit(
+        'timeline', settings.FOLLOW_FEED_REFRESH_WORKERS,
+        _refresh, user_id, lock
+    )
+
+
+def cached_head(user_id):
+    """ Начало ленты из кэша (stale-while-revalidate): устаревшая копия
+        отдается сразу, а свежая собирается для следующих запросов."""
+    head = cache.get(HEAD_KEY.format(user_id))
+    if head is None:
+        return build_head(user_id)
+    if _is_stale(user_id, head):
+        refresh_head(user_id)
+    return head
+
+
+def keys_from_head(head, cursor, forward, limit):
+    """ Ключи страницы из закэшированного начала ленты или None,
+        если страница выходит за его пределы."""
+    keys = head['keys']
+    if forward:
+        found = [key for key in keys if cursor is None or key < cursor]
+        if len(found) >= limit or head['complete']:
+            return found[:limit]
+        return None
+    if not head['complete'] and (not keys or cursor < keys[-1]):
+        return None
+    return [key for key in reversed(keys) if key > cursor][:limit]
+
+
+class TimelinePaginator(KeysetPaginator):
+    """ Паджинатор ленты подписок пользователя.
+        В курсорном режиме сливает два отсортированных потока:
+        записи Inbox (посты, разложенные при публикации) и посты
+        «тяжелых» авторов из подписок, которые читаются напрямую.
+        Первые страницы отдаются из закэшированного начала ленты
+        (без него, если use_head=False, - для замеров).
+        Номерные страницы листают object_list (join по Follow).
+    """
+    def __init__(self, object_list, per_page, user=None, use_head=True,
+                 **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.user = user
+        self.use_head = use_head
+
+    def seek(self, cursor, forward=True):
+        limit = self.per_page + 1
+        keys = None
+        if self.use_head:
+            head = cached_head(self.user.pk)
+            keys = keys_from_head(head, cursor, forward, limit)
+        if keys is None:
+            keys = _seek_keys(
+                self.user.pk, _followed_pulled(self.user.pk),
+                cursor, forward, limit
+            )
+        posts = Post.objects.for_feed().in_bulk([pk for _, pk in keys])
+        return [posts[pk] for _, pk in keys if pk in posts]
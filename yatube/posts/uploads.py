@@ -0,0 +1,67 @@
+import tempfile
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from PIL import Image, ImageOps
+
+# Тег EXIF с ориентацией снимка
+ORIENTATION = 0x0112
+# Качество перекодированных JPEG и WebP
+QUALITY = 90
+# Во сколько раз уменьшенный черновик (draft/reduce) должен быть больше
+# итогового размера, чтобы сглаживание оставалось качественным
+REDUCING_GAP = 2.0
+
+
+def _needs_normalizing(image):
+    return (
+        max(image.size) > settings.POST_IMAGE_MAX_SIDE
+        or 'exif' in image.info
+        or image.getexif().get(ORIENTATION, 1) != 1
+    )
+
+
+def normalize_image(upload):
+    """ Приводит загруженную картинку поста к безопасному виду:
+        - отклоняет картинки больше POST_IMAGE_MAX_PIXELS пикселей
+          (размер читается из заголовка, до декодирования);
+        - уменьшает картинку до POST_IMAGE_MAX_SIDE по большей стороне,
+          декодируя JPEG сразу в уменьшенном масштабе (draft),
+          а остальные форматы - с грубым уменьшением (reduce);
+        - поворачивает снимок по EXIF и удаляет EXIF.
+        Картинка читается из временного файла загрузки, результат
+        пишется во временный файл. Картинка, которую менять не нужно
+        (и анимированная), возвращается как есть.
+    """
+    upload.seek(0)
+    try:
+        image = Image.open(upload)
+    except (Image.DecompressionBombError, OSError):
+        raise ValidationError(
+            'Не удалось прочитать изображение', code='invalid_image'
+        )
+    width, height = image.size
+    if width * height > settings.POST_IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            'Изображение слишком большое: %(width)sx%(height)s',
+            code='image_too_large',
+            params={'width': width, 'height': height},
+        )
+    if getattr(image, 'is_animated', False) or not _needs_normalizing(image):
+        upload.seek(0)
+        return upload
+    image_format = image.format
+    max_side = settings.POST_IMAGE_MAX_SIDE
+    image.thumbnail(
+        (max_side, max_side), Image.LANCZOS, reducing_gap=REDUCING_GAP
+    )
+    image = ImageOps.exif_transpose(image)
+    image.info.pop('exif', None)
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L', 'CMYK'):
+        image = image.convert('RGB')
+    options = {'quality': QUALITY} if image_format in ('JPEG', 'WEBP') else {}
+    output = tempfile.TemporaryFile()
+    image.save(output, format=image_format, **options)
+    output.seek(0)
+    return File(output, name=upload.name)
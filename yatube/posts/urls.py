@@ -14,6 +14,12 @@ urlpatterns = [
     path('profile/<str:username>/', views.profile, name='profile'),
     # Просмотр записи
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
+    # Следующие комментарии к записи (фрагмент страницы)
+    path(
+        'posts/<int:post_id>/comments/',
+        views.post_comments,
+        name='post_comments'
+    ),
     # Создание новой записи
     path('create/', views.post_create, name='post_create'),
     # Редактирование одной из своих записей
@@ -1,36 +1,76 @@
+from functools import partial
+
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.http import Http404
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
 
+from users.cache import get_user_by_username
+
+from .counters import get_posts_count
 from .forms import CommentForm, PostForm
-from .models import (Group, Post, User, Follow)
+from .page_cache import (cache_page_versioned, group_scopes, index_scopes,
+                         post_scopes, profile_scopes)
+from .models import (Comment, Group, Post, Follow)
+from .paginators import KeysetPaginator
+from .thumbnails import image_variants
+from .timeline import TimelinePaginator
+
+
+def get_author_or_404(username):
+    # Автор читается из кэша (users.cache)
+    author = get_user_by_username(username)
+    if author is None:
+        raise Http404('Автор не найден')
+    return author
 
 
-def get_page_from_paginator(list_items, request):
+def get_page_from_paginator(list_items, request,
+                            paginator_class=KeysetPaginator, **kwargs):
     """ Функция для вызова паджинатора.
         Возвращает объект page_obg с разбитыми постранично элементами.
+        По умолчанию страницы выбираются по курсору (?after=/?before=),
+        старые ссылки вида ?page=N продолжают работать.
         """
+    p = paginator_class(list_items, settings.PAGINATION_COUNT, **kwargs)
     page_number = request.GET.get('page')
-    p = Paginator(list_items, settings.PAGINATION_COUNT)
-    page_obj = p.get_page(page_number)
+    if page_number is not None:
+        return p.get_page(page_number)
+    page_obj = p.get_cursor_page(
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
     return page_obj
 
 
-@cache_page(20, cache='default', key_prefix='index_page')
+def get_comments_page(post_id, after=None):
+    """ Страница комментариев поста, новые сверху.
+        Авторы выбираются тем же запросом, что и комментарии."""
+    comments = Comment.objects.filter(post_id=post_id).select_related('author')
+    paginator = KeysetPaginator(
+        comments, settings.COMMENTS_PAGINATION_COUNT, keys=('created', 'id')
+    )
+    return paginator.get_cursor_page(after=after)
+
+
+@cache_page_versioned(index_scopes)
 def index(request):
-    post_list = Post.objects.all()
+    post_list = Post.objects.for_feed()
     context = {
-        'page_obj': get_page_from_paginator(post_list, request)
+        'page_obj': get_page_from_paginator(
+            post_list, request, count=get_posts_count
+        )
     }
     return render(request, 'posts/index.html', context)
 
 
+@cache_page_versioned(group_scopes)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    page_obj = get_page_from_paginator(posts, request)
+    posts = group.posts.for_feed()
+    page_obj = get_page_from_paginator(
+        posts, request, count=partial(get_posts_count, group_id=group.pk)
+    )
     context = {
         'group': group,
         'page_obj': page_obj
@@ -38,33 +78,53 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+@cache_page_versioned(profile_scopes)
 def profile(request, username):
-    author_profile = get_object_or_404(User, username=username)
-    author_posts = author_profile.posts.all()
-    page_obj = get_page_from_paginator(author_posts, request)
-    following = request.user.is_authenticated and Follow.objects.filter(
-        user=request.user,
-        author=author_profile
-    ).exists()
+    author_profile = get_author_or_404(username)
+    author_posts = author_profile.posts.for_feed()
+    posts_count = get_posts_count(author_id=author_profile.pk)
+    page_obj = get_page_from_paginator(
+        author_posts, request, count=lambda: posts_count
+    )
     context = {
         'author': author_profile,
-        'following': following,
+        'posts_count': posts_count,
         'page_obj': page_obj,
     }
     return render(request, 'posts/profile.html', context)
 
 
+@cache_page_versioned(post_scopes)
 def post_detail(request, post_id):
     current_post = get_object_or_404(Post, id=post_id)
-    comments = current_post.comments.all()
     context = {
         'current_post': current_post,
+        'author_posts_count': get_posts_count(
+            author_id=current_post.author_id
+        ),
         'form': CommentForm(),
-        'comments': comments,
+        'image_variants': image_variants([current_post]).get(
+            current_post.pk
+        ),
+        'post_id': current_post.pk,
+        'comments': get_comments_page(current_post.pk),
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+@cache_page_versioned(post_scopes)
+def post_comments(request, post_id):
+    """ Фрагмент страницы поста со следующими комментариями:
+        его подгружает ссылка «Показать еще комментарии»."""
+    if not Post.objects.filter(pk=post_id).exists():
+        raise Http404('Пост не найден')
+    context = {
+        'post_id': post_id,
+        'comments': get_comments_page(post_id, request.GET.get('after')),
+    }
+    return render(request, 'posts/includes/comments.html', context)
+
+
 @login_required
 def post_create(request):
     """ Добавляет новую запись."""
@@ -119,13 +179,17 @@ def add_comment(request, post_id):
 @login_required
 def follow_index(request):
     """ Представляет страницу со списком постов всех авторов,
-        на которых подписан текущий пользователь"""
+        на которых подписан текущий пользователь.
+        Посты берутся из заранее собранной ленты Inbox, посты авторов
+        с большим числом подписчиков подмешиваются при чтении."""
     followed_posts = (
-        Post.objects.filter(
+        Post.objects.for_feed().filter(
             author__following__user=request.user
         )
     )
-    page_obj = get_page_from_paginator(followed_posts, request)
+    page_obj = get_page_from_paginator(
+        followed_posts, request, TimelinePaginator, user=request.user
+    )
     context = {'page_obj': page_obj}
     return render(request, 'posts/follow.html', context)
 
@@ -133,7 +197,7 @@ def follow_index(request):
 @login_required
 def profile_follow(request, username):
     """ Функция реализует возможность подписаться на автора."""
-    author = get_object_or_404(User, username=username)
+    author = get_author_or_404(username)
     if author != request.user:
         # Если подписка уже есть, или пользователь рассматривает свою страницу
         # тогда запрос на подписку будет проигнорирован
@@ -144,6 +208,6 @@ def profile_follow(request, username):
 @login_required
 def profile_unfollow(request, username):
     """ Функция реализует возможность отписаться от автора."""
-    author = get_object_or_404(User, username=username)
+    author = get_author_or_404(username)
     get_object_or_404(Follow, user=request.user, author=author).delete()
     return redirect('posts:profile', username)
@@ -0,0 +1,24 @@
+// Подгрузка следующих комментариев без перезагрузки страницы:
+// ссылка «Показать еще комментарии» заменяется полученным фрагментом,
+// в конце которого стоит ссылка на следующую порцию
+document.addEventListener('click', function (event) {
+  var link = event.target.closest('[data-more-comments]');
+  if (!link) {
+    return;
+  }
+  event.preventDefault();
+  fetch(link.href, {credentials: 'same-origin'})
+    .then(function (response) {
+      if (!response.ok) {
+        throw new Error(response.status);
+      }
+      return response.text();
+    })
+    .then(function (html) {
+      link.outerHTML = html;
+    })
+    .catch(function () {
+      // Без подгрузки ссылка открывает фрагмент как отдельную страницу
+      window.location = link.href;
+    });
+});
@@ -0,0 +1,17 @@
+from django.contrib.auth.backends import ModelBackend
+
+from .cache import User, get_user
+
+
+class CachedModelBackend(ModelBackend):
+    """ ModelBackend, который берет пользователя сессии из кэша:
+        запрос авторизованного пользователя не читает его из БД.
+        После сохранения пользователя (в том числе смены пароля)
+        запись сбрасывается (users.signals), поэтому устаревший
+        хэш пароля не продлит сессию.
+    """
+    def get_user(self, user_id):
+        user = get_user(User._meta.pk.to_python(user_id))
+        if user is not None and self.user_can_authenticate(user):
+            return user
+        return None
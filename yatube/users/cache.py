@@ -0,0 +1,82 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+User = get_user_model()
+
+USER_KEY = 'user:{}'
+USERNAME_KEY = 'user:name:{}'
+# Хэш пароля в общий кэш не попадает: поле password у пользователя
+# из кэша отложено и читается из БД, только если к нему обратятся
+CACHED_FIELDS = [
+    field.attname for field in User._meta.concrete_fields
+    if field.attname != 'password'
+]
+
+
+def username_key(username):
+    # Имя пользователя может содержать не-ASCII символы
+    return USERNAME_KEY.format(hashlib.md5(username.encode()).hexdigest())
+
+
+def _remember(user):
+    # Вместо пароля хранится хэш сессии (HMAC от хэша пароля
+    # на SECRET_KEY): с ним сверяется сессия в каждом запросе
+    entry = (
+        [getattr(user, name) for name in CACHED_FIELDS],
+        user.get_session_auth_hash(),
+    )
+    cache.set_many({
+        USER_KEY.format(user.pk): entry,
+        username_key(user.username): user.pk,
+    }, settings.USER_CACHE_TIMEOUT)
+
+
+def _restore(entry):
+    values, session_hash = entry
+    user = User.from_db(DEFAULT_DB_ALIAS, CACHED_FIELDS, values)
+    model_hash = user.get_session_auth_hash
+
+    def get_session_auth_hash():
+        # Пока пароль не прочитан (и не сменен), хэш сессии - из кэша
+        if 'password' in user.get_deferred_fields():
+            return session_hash
+        return model_hash()
+
+    user.get_session_auth_hash = get_session_auth_hash
+    return user
+
+
+def get_user(pk):
+    """ Пользователь по id (из кэша) или None."""
+    entry = cache.get(USER_KEY.format(pk))
+    if entry is not None:
+        return _restore(entry)
+    user = User.objects.filter(pk=pk).first()
+    if user is not None:
+        _remember(user)
+    return user
+
+
+def get_user_by_username(username):
+    """ Пользователь по имени (из кэша) или None.
+        Имя хранится как ссылка на id: запись пользователя одна,
+        и после смены имени старая ссылка просто не совпадет.
+    """
+    pk = cache.get(username_key(username))
+    if pk is not None:
+        user = get_user(pk)
+        if user is not None and user.username == username:
+            return user
+    user = User.objects.filter(username=username).first()
+    if user is not None:
+        _remember(user)
+    return user
+
+
+def forget(user):
+    """ Сбрасывает пользователя после изменения или удаления."""
+    cache.delete(USER_KEY.format(user.pk))
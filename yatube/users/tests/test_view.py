@@ -1,4 +1,7 @@
+from http import HTTPStatus
+
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.test import Client, TestCase
 from django.urls import reverse
 
@@ -54,3 +57,75 @@ class UsersViewClass(TestCase):
             with self.subTest(template=template):
                 response = self.authorised_client.get(reverse_name)
                 self.assertTemplateUsed(response, template)
+
+
+class CachedUserTest(TestCase):
+    """ Класс проверяет чтение пользователя сессии из кэша."""
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = User.objects.create_user(username='cached')
+        self.client.force_login(self.user)
+
+    def test_session_user_from_cache(self):
+        """ Повторный запрос не читает из БД ни сессию, ни пользователя."""
+        url = reverse('about:author')
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.context['user'], self.user)
+
+    def test_password_change_ends_session(self):
+        """ После смены пароля пользователь из кэша не продлит сессию."""
+        url = reverse('users:password_change')
+        self.client.get(url)
+        self.user.set_password('new-password')
+        self.user.save()
+        response = self.client.get(url)
+        self.assertRedirects(
+            response, f'{reverse("users:login")}?next={url}'
+        )
+
+    def test_password_not_cached(self):
+        """ В кэш не попадает хэш пароля, а пользователь из кэша
+            читает пароль из БД, только когда он нужен."""
+        self.user.set_password('old-password')
+        self.user.save()
+        self.client.force_login(self.user)
+        self.client.get(reverse('about:author'))
+        self.assertNotIn(
+            self.user.password, repr(cache.get(f'user:{self.user.pk}'))
+        )
+        response = self.client.post(reverse('users:password_change'), {
+            'old_password': 'old-password',
+            'new_password1': 'Ne3-pass-word',
+            'new_password2': 'Ne3-pass-word',
+        })
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('Ne3-pass-word'))
+        # Сессия обновлена под новый пароль и не сброшена
+        response = self.client.get(reverse('users:password_change'))
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_old_sessions_stay_logged_in(self):
+        """ Сессии, открытые с ModelBackend, не сбрасываются."""
+        self.client.force_login(
+            self.user, backend='django.contrib.auth.backends.ModelBackend'
+        )
+        response = self.client.get(reverse('users:password_change'))
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_profile_author_from_cache(self):
+        """ Страница автора после переименования находит его по новому
+            имени, а по старому - отвечает 404."""
+        url = reverse('posts:profile', kwargs={'username': 'cached'})
+        self.assertEqual(self.client.get(url).status_code, HTTPStatus.OK)
+        self.user.username = 'renamed'
+        self.user.save()
+        self.assertEqual(
+            self.client.get(url).status_code, HTTPStatus.NOT_FOUND
+        )
+        response = self.client.get(
+            reverse('posts:profile', kwargs={'username': 'renamed'})
+        )
+        self.assertEqual(response.context['author'], self.user)
@@ -11,6 +11,8 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import sys
+import tempfile
 import dotenv
 
 
@@ -30,6 +32,9 @@ SECRET_KEY = os.getenv('SECRET_KEY')
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
+# Запущены тесты (manage.py test или pytest)
+TESTING = sys.argv[1:2] == ['test'] or 'pytest' in sys.modules
+
 ALLOWED_HOSTS = [
     'www.krugger.pythonanywhere.com',
     'krugger.pythonanywhere.com',
@@ -86,6 +91,9 @@ TEMPLATES = [
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         # Мы храним шаблоны на уровне проекта
         'DIRS': [TEMPLATES_DIR],
+        # Без DEBUG Django сам оборачивает загрузчики в cached.Loader:
+        # шаблоны компилируются один раз на процесс (прогрев - при
+        # запуске сервера, см. yatube.wsgi)
         'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
@@ -109,7 +117,10 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # Отдельная база, например для замеров (bench_queries --seed)
+        'NAME': os.getenv(
+            'DATABASE_NAME', os.path.join(BASE_DIR, 'db.sqlite3')
+        ),
     }
 }
 
@@ -158,6 +169,15 @@ LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
 # LOGOUT_REDIRECT_URL = 'posts:index'
 PASSWORD_RESET_FORM_REDIRECT_URL = 'users:password_reset_done'
+# Пользователь сессии читается из кэша (users.backends).
+# ModelBackend остается в списке: сессии, открытые до перехода
+# на кэш, записаны с ним и без него были бы сброшены
+AUTHENTICATION_BACKENDS = [
+    'users.backends.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+# Сессии читаются из кэша, а в БД только записываются
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
 
 # Константа для работы кастомной страницы ошибки csrf
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
@@ -169,17 +189,108 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 # Константы применяемые в проекте
 PAGINATION_COUNT = 10
+# Комментариев на странице поста и в каждой подгрузке
+COMMENTS_PAGINATION_COUNT = 20
+# Размер пачки при раскладке постов по лентам подписчиков (posts.Inbox)
+INBOX_BATCH_SIZE = 500
+# Авторы, у которых подписчиков не меньше этого порога, в ленты
+# не раскладываются: их посты подмешиваются в ленту при чтении
+FEED_FANOUT_THRESHOLD = 1000
+# Обратно в ленты автор раскладывается, только когда подписчиков
+# станет меньше этого порога (чтобы не переключаться у самой границы)
+FEED_FANOUT_RELEASE_THRESHOLD = 800
+# Время жизни закэшированного множества таких авторов (секунды);
+# пересчитывает его периодическая команда update_pulled_authors
+FEED_PULLED_AUTHORS_TIMEOUT = 300
+# Время жизни закэшированного множества подписок пользователя (секунды)
+FOLLOW_SET_TIMEOUT = 60 * 60 * 24
+# Время жизни закэшированного пользователя (секунды)
+USER_CACHE_TIMEOUT = 60 * 60
+# Сколько первых страниц ленты подписок держать в кэше
+FOLLOW_FEED_CACHED_PAGES = 3
+# Время жизни закэшированного начала ленты (секунды)
+FOLLOW_FEED_CACHE_TIMEOUT = 60 * 60
+# Устаревшее начало ленты пересобирает пул из стольких потоков
+# (core.background); False - тот же запрос. С SQLite пул, как и для
+# миниатюр, не используется
+FOLLOW_FEED_REFRESH_WORKERS = 2
+FOLLOW_FEED_REFRESH_ASYNC = True
+# Сколько секунд пересборка ленты считается идущей
+FOLLOW_FEED_REFRESH_LOCK_TIMEOUT = 30
+# Время жизни страниц в кэше (секунды); после записей в БД
+# страницы обновляются сразу (см. posts.page_cache)
+PAGE_CACHE_TIMEOUT = 60 * 60 * 6
+# Версия кэша карточек постов: увеличьте после правки current_post.html
+POST_CARD_VERSION = 3
+# Время жизни карточки поста в кэше (секунды)
+POST_CARD_TIMEOUT = 60 * 60 * 24
+# Картинки постов больше стольких пикселей не принимаются
+POST_IMAGE_MAX_PIXELS = 50 * 1000 * 1000
+# Картинки постов уменьшаются до такой длины большей стороны
+POST_IMAGE_MAX_SIDE = 2560
+# Миниатюры картинок постов строит пул из стольких потоков
+# (posts.thumbnails); False - в том же процессе сразу после сохранения.
+# С SQLite пул не используется (core.background): его записи
+# блокировали бы базу для записей запроса
+THUMBNAIL_WORKERS = 2
+THUMBNAIL_ASYNC = True
+# Хранилище ключей sorl с чтением многих миниатюр сразу
+THUMBNAIL_KVSTORE = 'posts.kvstore.KVStore'
+# Сборщик мусора media_gc: сколько имен файлов держать в памяти
+# за один проход (от этого зависит число проходов)
+MEDIA_GC_PARTITION_SIZE = 100000
+# Файлы моложе стольких секунд не удаляются: пост с ними может
+# быть еще не сохранен
+MEDIA_GC_MIN_AGE = 60 * 60 * 24
+# Защита от одновременной пересборки записей кэша (core.single_flight):
+# сколько секунд держится блокировка пересборки
+SINGLE_FLIGHT_LOCK_TIMEOUT = 10
+# сколько секунд после своего срока запись еще отдается,
+# пока ее пересобирает другой запрос
+SINGLE_FLIGHT_STALE_TIMEOUT = 60
+# сколько секунд ждать чужой пересборки, если копии нет совсем
+SINGLE_FLIGHT_WAIT = 2
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/2.2/howto/static-files/
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
-# подключение бэкенда кеширования
+# Тесты очищают кэш при создании тестовой базы (core.apps),
+# поэтому у них свой каталог кэша, а не каталог сервера
+if TESTING:
+    CACHE_LOCATION = os.path.join(tempfile.gettempdir(), 'yatube_test_cache')
+else:
+    CACHE_LOCATION = os.getenv(
+        'CACHE_LOCATION', os.path.join(tempfile.gettempdir(), 'yatube_cache')
+    )
+
+# подключение бэкенда кеширования: быстрый L1 в памяти процесса
+# поверх общего для всех процессов файлового кэша (см. core.cache)
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'BACKEND': 'core.cache.TieredCache',
+        'OPTIONS': {
+            'L2': 'shared',
+            # Записей в L1 одного процесса
+            'MAX_ENTRIES': 5000,
+            # Сколько секунд L1 может отдавать значение, не сверяясь с L2
+            'L1_TIMEOUT': 5,
+            # Сессии и пользователи (users.cache) читаются только из L2:
+            # выход или смена пароля не должны ждать L1_TIMEOUT
+            'L2_ONLY': ['django.contrib.sessions.cached_db', 'user:'],
+        },
+    },
+    'shared': {
+        # FileBasedCache с атомарным между процессами add
+        'BACKEND': 'core.cache.FileCache',
+        'LOCATION': CACHE_LOCATION,
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+            # Чистка перебирает весь каталог: не чаще раза в 1000 записей
+            'CULL_EVERY': 1000,
+        },
+    },
 }
 
 DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
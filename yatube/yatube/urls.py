@@ -31,7 +31,9 @@ urlpatterns = [
     # тогда Джанго будет искать их в модуле django.contrib.auth,
     # так как они идут ПОСЛЕ users.urls
     path('auth/', include('django.contrib.auth.urls')),
-    path('about/', include('about.urls', namespace='about'))
+    path('about/', include('about.urls', namespace='about')),
+    # Служебные метрики (только для сотрудников)
+    path('metrics/', include('core.urls', namespace='core')),
 ]
 if settings.DEBUG:
     urlpatterns += static(
@@ -9,8 +9,15 @@ https://docs.djangoproject.com/en/2.2/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
 
 application = get_wsgi_application()
+
+if not settings.DEBUG:
+    # Шаблоны компилируются до первого запроса (только в процессе
+    # сервера, а не при каждой команде manage.py)
+    from core.warmup import warm_templates
+    warm_templates()